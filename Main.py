@@ -2,11 +2,29 @@ import discord
 from discord.ext import commands, tasks
 import json
 import os
+import sys
+import sqlite3
 import asyncio
 import aiofiles
+import bisect
+import heapq
+import numpy as np
+import contextvars
+import copy
 import time
+import threading
+import traceback
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
+try:
+    import orjson  # isteğe bağlı, kuruluysa JSON kodlama/çözme için kullanılır
+except ImportError:
+    orjson = None
+
 async def ensure_file_exists(filename):
     if not os.path.exists(filename):
         async with aiofiles.open(filename, 'w') as f:
@@ -19,6 +37,7 @@ DATA_FILE = "MAINBank.json"
 COMPANY_FILE = "MAINCompanies.json"
 STOCK_FILE = "MAINStockMarket.json"
 USER_STOCK_FILE = "MAINUserStocks.json"
+ORDER_FILE = "MAINOrders.json"
 
 # Mesaj gönderilecek kanallar (kanal ID'lerini kendi sunucuna göre ayarla)
 STOCK_MARKET_CHANNEL_ID = 1390260591091908640
@@ -30,30 +49,700 @@ intents.message_content = True
 
 bot = commands.Bot(command_prefix="!", intents=intents)
 
-# Dosya erişim kilitleri
-data_lock = asyncio.Lock()
-company_lock = asyncio.Lock()
-stock_lock = asyncio.Lock()
-user_stock_lock = asyncio.Lock()
-
 async def ensure_file_exists(path):
     if not os.path.exists(path):
         async with aiofiles.open(path, 'w') as f:
             await f.write('{}')
 
-async def read_json(path, lock):
-    async with lock:
+# Depolama arka ucu: "json" (her store ayrı MAIN*.json dosyası) ya da "sqlite"
+# (tek veritabanı, her store bir tablo, her kullanıcı bir satır). STORAGE_BACKEND ile seçilir.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "MAINEconomy.db")
+
+# Kodlama döngüde yapılır: baytlar o anki verinin tutarlı anlık görüntüsüdür, komutlar
+# yazma sürerken satırları değiştirebilir. Diske yazma ve fsync ile çözme döngü dışındadır.
+# JSON_COMPACT=1 girintisiz yazar; JSON_EXECUTOR=process çözmeyi ayrı bir süreçte yapar.
+JSON_COMPACT = os.getenv("JSON_COMPACT", "0") == "1"
+JSON_EXECUTOR = os.getenv("JSON_EXECUTOR", "thread").lower()
+json_pool = None
+
+def decode_json(content):
+    if not content.strip():
+        return {}
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+def encode_json(data, compact=JSON_COMPACT):
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=0 if compact else orjson.OPT_INDENT_2).decode()
+        except TypeError:
+            pass  # 64 bit'e sığmayan sayılar, standart kütüphaneye düş
+    if compact:
+        return json.dumps(data, separators=(",", ":"))
+    return json.dumps(data, indent=4)
+
+async def offload(func, *args, processes=False):
+    # Argümanlar değişmez olmalı (str/bytes/kodlanmış satırlar); canlı store sözlükleri verilmez
+    global json_pool
+    if processes and JSON_EXECUTOR == "process":
+        if json_pool is None:
+            json_pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        return await asyncio.get_running_loop().run_in_executor(json_pool, func, *args)
+    return await asyncio.to_thread(func, *args)
+
+
+class JsonStorage:
+    name = "json"
+
+    async def load(self, path):
         await ensure_file_exists(path)
         async with aiofiles.open(path, 'r') as f:
             content = await f.read()
-            if content.strip() == '':
-                return {}
-            return json.loads(content)
+        return await offload(decode_json, content, processes=True), len(content)
+
+    async def save(self, path, data, keys=None, seq=None):
+        # JSON dosyası satır satır yazılamaz, keys yok sayılır
+        if seq is not None:
+            data = {**data, JOURNAL_SEQ_KEY: seq}
+        content = encode_json(data)
+        await offload(atomic_write, path, content)
+        return len(content)
+
+
+def atomic_write(path, content):
+    # Önce geçici dosyaya yaz, diske indir, sonra tek adımda yerine koy.
+    # Yazma sırasında çökme olursa eski dosya bozulmadan kalır.
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class SqliteStorage:
+    name = "sqlite"
+
+    def __init__(self, db_path):
+        # Bağlantı iş parçacıklarından kullanılır, erişimi kendi kilidimiz sıralar
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.tables = {}
+        self.conn_lock = threading.Lock()
+
+    def table(self, path):
+        # "MAINBank.json" -> "mainbank"
+        if path not in self.tables:
+            name = os.path.splitext(os.path.basename(path))[0].lower()
+            self.conn.execute(f'CREATE TABLE IF NOT EXISTS "{name}" (id TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            self.tables[path] = name
+        return self.tables[path]
+
+    def load_sync(self, path):
+        with self.conn_lock:
+            rows = self.conn.execute(f'SELECT id, value FROM "{self.table(path)}"').fetchall()
+        return {key: decode_json(value) for key, value in rows}, sum(len(value) for _, value in rows)
+
+    def encode_rows(self, data, keys, seq):
+        changed = list(data.keys()) if keys is None else keys
+        upserts = [(key, encode_json(data[key], True)) for key in changed if key in data]
+        deletes = [(key,) for key in changed if key not in data]
+        if seq is not None:
+            upserts.append((JOURNAL_SEQ_KEY, json.dumps(seq)))
+        return upserts, deletes
+
+    def save_sync(self, path, upserts, deletes, replace):
+        with self.conn_lock, self.conn:
+            table = self.table(path)
+            if replace:
+                self.conn.execute(f'DELETE FROM "{table}"')
+            self.conn.executemany(f'INSERT OR REPLACE INTO "{table}" (id, value) VALUES (?, ?)', upserts)
+            self.conn.executemany(f'DELETE FROM "{table}" WHERE id = ?', deletes)
+        return sum(len(value) for _, value in upserts)
+
+    async def load(self, path):
+        return await offload(self.load_sync, path)
+
+    async def save(self, path, data, keys=None, seq=None):
+        # Satırlar döngüde kodlanır, iş parçacığı sadece hazır metni yazar
+        upserts, deletes = self.encode_rows(data, keys, seq)
+        return await offload(self.save_sync, path, upserts, deletes, keys is None)
+
+
+storage = SqliteStorage(SQLITE_PATH) if STORAGE_BACKEND == "sqlite" else JsonStorage()
+
+# Bellek içi durum önbelleği: her store bir kez okunur, okumalar bellekten yapılır.
+# Anahtarlı yazmalar günlüğe eklenir; anahtarsız yazmalar store'u kirletir ve belirli
+# aralıklarla ve kapanışta diske yazılır. STATE_FLUSH_INTERVAL=0 ise hemen yazılır.
+STATE_FLUSH_INTERVAL = float(os.getenv("STATE_FLUSH_INTERVAL", "10"))
+
+# Grup commit: her store'un diske yazan tek bir görevi vardır. Kısa bir pencere içinde
+# gelen tüm yazma istekleri tek bir atomik commit ile diske iner.
+GROUP_COMMIT_WINDOW = float(os.getenv("GROUP_COMMIT_WINDOW", "0.05"))
+
+class StoreWriter:
+    def __init__(self, store):
+        self.store = store
+        self.waiting = []  # commit'i bekleyen future'lar
+        self.wakeup = asyncio.Event()
+        self.checkpoint = False
+        self.task = None
+        self.started = time.time()
+        self.commits = 0
+        self.requests = 0
+
+    async def request(self, checkpoint=False):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.append(future)
+        self.checkpoint = self.checkpoint or checkpoint
+        self.wakeup.set()
+        await future
+
+    async def run(self):
+        while True:
+            await self.wakeup.wait()
+            await asyncio.sleep(GROUP_COMMIT_WINDOW)
+            self.wakeup.clear()
+            batch, self.waiting = self.waiting, []
+            checkpoint, self.checkpoint = self.checkpoint, False
+            try:
+                await flush_store(self.store, checkpoint)
+            except Exception as e:
+                for future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.commits += 1
+            self.requests += len(batch)
+            for future in batch:
+                if not future.done():
+                    future.set_result(None)
+
+    def summary(self):
+        elapsed = max(time.time() - self.started, 1e-9)
+        batch = self.requests / self.commits if self.commits else 0
+        return f"commits={self.commits} ({self.commits / elapsed:.2f}/s) avg_batch={batch:.1f}"
+
+
+# Gecikme histogramı: sabit kovalar (saniye), p50/p99 kova üst sınırından tahmin edilir
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q):
+        seen = 0
+        for bound, n in zip(LATENCY_BUCKETS + (float("inf"),), self.counts):
+            seen += n
+            if seen and seen >= q * self.count:
+                return bound
+        return 0.0
+
+    def prometheus(self, name, labels):
+        lines = []
+        seen = 0
+        for bound, n in zip(LATENCY_BUCKETS, self.counts):
+            seen += n
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {seen}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum:.6f}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+
+def format_latency(seconds):
+    if seconds == float("inf"):
+        return f">{LATENCY_BUCKETS[-1]}s"
+    return f"{seconds * 1000:g}ms"
+
+
+# Store kaydı: her dosya yolu için tek bir Store nesnesi (kilit, bellekteki içerik,
+# bekleyen değişiklikler, yazıcı görev ve istatistikler). Tüm okuma/yazmalar buradan geçer.
+class Store:
+    def __init__(self, path):
+        self.path = path
+        self.lock = asyncio.Lock()
+        self.data = None
+        self.dirty = False         # anahtarsız yazma oldu, tüm store yazılacak
+        self.journal_keys = set()  # günlükte olup henüz snapshot'a yazılmamış anahtarlar
+        self.writer = StoreWriter(self)
+        self.stats = {"reads": 0, "hits": 0, "misses": 0, "read_bytes": 0, "writes": 0, "journal_bytes": 0,
+                      "flushes": 0, "flushed_bytes": 0, "lock_waits": 0, "lock_wait_time": 0.0}
+        # parse: yükleme + çözme, dump: kodlama + yazma, write: write_json çağrısı
+        self.timings = {"parse": Histogram(), "dump": Histogram(), "write": Histogram(), "lock_wait": Histogram()}
+
+    @asynccontextmanager
+    async def locked(self):
+        if self.lock.locked():
+            self.stats["lock_waits"] += 1
+        started = time.perf_counter()
+        async with self.lock:
+            waited = time.perf_counter() - started
+            self.stats["lock_wait_time"] += waited
+            self.timings["lock_wait"].observe(waited)
+            yield
+
+
+stores = {}  # path -> Store
+
+def get_store(path):
+    store = stores.get(path)
+    if store is None:
+        store = stores[path] = Store(path)
+    return store
+
+# Dosya erişim kilitleri (her dosyanın tek kilidi store kaydında durur)
+data_lock = get_store(DATA_FILE).lock
+company_lock = get_store(COMPANY_FILE).lock
+stock_lock = get_store(STOCK_FILE).lock
+user_stock_lock = get_store(USER_STOCK_FILE).lock
+
+async def read_json(path, lock=None):
+    # lock parametresi eski çağrılar için duruyor, kilit store kaydından gelir
+    store = get_store(path)
+    store.stats["reads"] += 1
+    if store.data is not None:
+        store.stats["hits"] += 1
+        return store.data
+
+    async with store.locked():
+        if store.data is None:
+            store.stats["misses"] += 1
+            started = time.perf_counter()
+            data, size = await storage.load(path)
+            store.timings["parse"].observe(time.perf_counter() - started)
+            store.stats["read_bytes"] += size
+            replayed = state_journal.recover(path, data)
+            if replayed:
+                print(f"[journal] replayed {replayed} entries into {path}")
+            # Eski biçimdeki satırlar yüklenirken çevrilir, yeni biçim ilk flush'ta diske iner
+            migrate = STORE_MIGRATIONS.get(path)
+            if migrate is not None and migrate(data):
+                print(f"[storage] migrated {path} to the current format")
+                store.dirty = True
+            store.data = data
+    return store.data
+
+async def write_json(path, data, lock=None, keys=None):
+    # keys verilirse sadece o satırlar günlüğe eklenir, store dosyası checkpoint'te yazılır
+    store = get_store(path)
+    store.data = data
+    store.stats["writes"] += 1
+    started = time.perf_counter()
+
+    if keys is not None:
+        entries = [{"store": path, "key": key, "row": data.get(key)} for key in keys]
+        if entries:
+            state_journal.write({"reason": "write", "entries": entries})
+        for key in keys:
+            row_changed(path, data, key)
+    else:
+        store.dirty = True
+        store_replaced(path, data)
+        if STATE_FLUSH_INTERVAL <= 0:
+            await store.writer.request()
+    store.timings["write"].observe(time.perf_counter() - started)
+
+async def flush_store(store, checkpoint=False):
+    async with store.locked():
+        if store.data is None or not (store.dirty or (checkpoint and store.journal_keys)):
+            return
+        keys = None if store.dirty else store.journal_keys
+        store.dirty = False
+        store.journal_keys = set()
+        started = time.perf_counter()
+        try:
+            written = await storage.save(store.path, store.data, keys, seq=state_journal.seq)
+        except Exception:
+            store.dirty = True  # bir sonraki flush tüm store'u yazsın
+            raise
+        store.timings["dump"].observe(time.perf_counter() - started)
+        store.stats["flushes"] += 1
+        store.stats["flushed_bytes"] += written
+
+async def commit_store(path):
+    await get_store(path).writer.request()
+
+async def flush_all_stores():
+    await asyncio.gather(*(store.writer.request() for store in list(stores.values()) if store.dirty))
+
+def cache_summary():
+    total = {}
+    for store in stores.values():
+        for name, value in store.stats.items():
+            total[name] = total.get(name, 0) + value
+    saved = total.get("writes", 0) - total.get("flushes", 0)
+    lines = [f"[cache] backend={storage.name} hits={total.get('hits', 0)} misses={total.get('misses', 0)} "
+             f"writes={total.get('writes', 0)} flushes={total.get('flushes', 0)} "
+             f"({total.get('flushed_bytes', 0):,} bytes) saved_writes={saved}"]
+    for path, store in stores.items():
+        lines.append(f"[store] {path} {store.writer.summary()} lock_waits={store.stats['lock_waits']} "
+                     f"({store.stats['lock_wait_time'] * 1000:.1f} ms)")
+    lines.append(f"[portfolio] hits={portfolio_cache.hits} misses={portfolio_cache.misses}")
+    return "\n".join(lines)
+
+# İşlem günlüğü: tüm store'lardaki anahtarlı değişiklikler ve bakiye hareketleri
+# MAINState.journal dosyasına satır satır eklenir, store dosyaları checkpoint'te yazılır.
+# Her store snapshot'ı içerdiği son günlük sırasını saklar; açılışta snapshot yüklenip
+# günlüğün kalanı oynatılır. Kayıtlar değişiklik sonrası değeri tuttuğu için tekrar
+# oynatmak güvenlidir. Bir satır tek seferde yazıldığı için çok store'lu işlemler atomiktir.
+JOURNAL_FILE = "MAINState.journal"
+LEGACY_JOURNAL_FILE = "MAINBank.journal"  # eski sürümün sadece banka günlüğü
+JOURNAL_COMPACT_INTERVAL = float(os.getenv("JOURNAL_COMPACT_INTERVAL", "300"))
+JOURNAL_MAX_ENTRIES = int(os.getenv("JOURNAL_MAX_ENTRIES", "50000"))
+JOURNAL_FSYNC = os.getenv("JOURNAL_FSYNC", "0") == "1"
+JOURNAL_SEQ_KEY = "__journal_seq__"  # snapshot'ın içerdiği son günlük sırası
+
+class StateJournal:
+    def __init__(self, path):
+        self.path = path
+        self.seq = 0
+        self.entries = 0      # son checkpoint'ten beri eklenen satır sayısı
+        self.file = None
+        self.pending = None   # path -> [(seq, kayıt)], store yüklenince uygulanır
+
+    def write(self, record):
+        if self.pending is None:
+            self.load()
+        if self.file is None:
+            self.file = open(self.path, 'a')
+            # Çökmede yarım kalan satır varsa yeni kayıt onunla birleşmesin
+            if self.file.tell() > 0:
+                with open(self.path, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        self.file.write("\n")
+        self.seq += 1
+        record["seq"] = self.seq
+        record["ts"] = time.time()
+        line = json.dumps(record) + "\n"
+        self.file.write(line)
+        self.file.flush()
+        if JOURNAL_FSYNC:
+            os.fsync(self.file.fileno())
+        self.entries += 1
+        touched = set()
+        for entry in record.get("entries", [record]):
+            if "store" in entry:
+                get_store(entry["store"]).journal_keys.add(entry["key"])
+                touched.add(entry["store"])
+        for path in touched:
+            get_store(path).stats["journal_bytes"] += len(line)
+
+    def segments(self):
+        # Checkpoint'te ayrılmış eski parçalar: MAINState.journal.<seq>
+        folder = os.path.dirname(self.path) or "."
+        found = []
+        for base in (LEGACY_JOURNAL_FILE, os.path.basename(self.path)):
+            prefix = base + "."
+            for name in os.listdir(folder):
+                if name.startswith(prefix) and name[len(prefix):].isdigit():
+                    found.append((int(name[len(prefix):]), os.path.join(folder, name)))
+        return sorted(found)
+
+    def load(self):
+        self.pending = {}
+        files = [path for _, path in self.segments()] + [LEGACY_JOURNAL_FILE, self.path]
+        for path in files:
+            if not os.path.exists(path):
+                continue
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # çökmede yarım kalmış satır
+                    self.seq = max(self.seq, record["seq"])
+                    for entry in record.get("entries", [record]):
+                        if "user" in entry and "store" not in entry:
+                            # Eski banka günlüğü kaydı
+                            entry = {**entry, "store": DATA_FILE, "key": entry["user"]}
+                        if "store" in entry:
+                            self.pending.setdefault(entry["store"], []).append((record["seq"], entry))
+
+    def recover(self, path, data):
+        if self.pending is None:
+            self.load()
+        snapshot_seq = data.pop(JOURNAL_SEQ_KEY, 0)
+        self.seq = max(self.seq, snapshot_seq)
+        replayed = 0
+        for seq, entry in self.pending.pop(path, []):
+            if seq > snapshot_seq:
+                apply_journal_entry(data, entry)
+                get_store(path).journal_keys.add(entry["key"])
+                replayed += 1
+        return replayed
+
+    def rotate(self):
+        # Mevcut günlük seq ile yeniden adlandırılır, yeni kayıtlar boş dosyaya gider
+        self.close()
+        seq = self.seq
+        if os.path.exists(self.path):
+            os.replace(self.path, f"{self.path}.{seq}")
+        # Yeni dosyaya işaret satırı: eski parçalar silinse de sıra numarası kaybolmaz
+        self.write({"mark": "checkpoint"})
+        self.entries = 0
+        return seq
+
+    def drop_segments(self, upto_seq):
+        for seq, path in self.segments():
+            if seq <= upto_seq:
+                os.remove(path)
+        if os.path.exists(LEGACY_JOURNAL_FILE):
+            os.remove(LEGACY_JOURNAL_FILE)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+state_journal = StateJournal(JOURNAL_FILE)
+checkpoint_lock = asyncio.Lock()
+
+def apply_journal_entry(data, entry):
+    key = entry["key"]
+    if "row" in entry:
+        if entry["row"] is None:
+            data.pop(key, None)
+        else:
+            data[key] = entry["row"]
+    else:
+        data.setdefault(key, {"bank_points": 0})["bank_points"] = entry["balance"]
+
+# Sıralama: (-puan, anahtar) çiftlerinin sıralı listesi, tek anahtar bisect ile güncellenir
+class Ranking:
+    def __init__(self):
+        self.entries = []  # (-puan, anahtar), artan sırada
+        self.scores = {}   # anahtar -> puan
+
+    def reset(self, scores):
+        self.scores = dict(scores)
+        self.entries = sorted((-score, key) for key, score in self.scores.items())
+
+    def set(self, key, score):
+        # score None ise anahtar sıralamadan çıkar
+        old = self.scores.pop(key, None)
+        if old is not None:
+            del self.entries[bisect.bisect_left(self.entries, (-old, key))]
+        if score is not None:
+            self.scores[key] = score
+            bisect.insort(self.entries, (-score, key))
+
+    def top(self, k):
+        return [key for _, key in self.entries[:k]]
+
+    def rank(self, key):
+        score = self.scores.get(key)
+        if score is None:
+            return None
+        return bisect.bisect_left(self.entries, (-score, key)) + 1
+
+
+# Zenginlik sıralaması: banka store'u ilk kullanımda bir kez taranır; sonra değişen her
+# banka satırı (bkz. row_changed) sıralamada yerine konur. Anahtarsız banka yazması
+# dizini yeniden kurdurur.
+class RankIndex:
+    def __init__(self):
+        self.data = None  # dizinin kurulduğu banka sözlüğü
+        self.ranking = Ranking()
+
+    def ensure(self, data):
+        if self.data is data:
+            return
+        self.data = data
+        self.ranking.reset((user_id, row.get("bank_points", 0)) for user_id, row in data.items() if isinstance(row, dict))
 
-async def write_json(path, data, lock):
-    async with lock:
-        async with aiofiles.open(path, 'w') as f:
-            await f.write(json.dumps(data, indent=4))
+    def update(self, data, user_id):
+        if self.data is not data:
+            return
+        row = data.get(user_id)
+        self.ranking.set(user_id, row.get("bank_points", 0) if isinstance(row, dict) else None)
+
+    def invalidate(self):
+        self.data = None
+
+    def top(self, data, k):
+        self.ensure(data)
+        return self.ranking.top(k)
+
+
+rank_index = RankIndex()
+
+# Bellekteki dizinlere satır değişikliği bildirimi: adjust_balance, anahtarlı yazmalar ve
+# işlem commit/rollback'i buradan geçer. Anahtarsız yazmalarda store_replaced çağrılır.
+def row_changed(path, data, key):
+    if path == DATA_FILE:
+        rank_index.update(data, key)
+    elif path == USER_STOCK_FILE:
+        holder_index.update(data, key)
+        portfolio_cache.invalidate(key)
+    elif path == STOCK_FILE:
+        owner_index.update(data, key)
+    net_worth.row_changed(path, data, key)
+
+def store_replaced(path, data):
+    if path == DATA_FILE:
+        rank_index.invalidate()
+    elif path == USER_STOCK_FILE:
+        holder_index.invalidate()
+        portfolio_cache.invalidate()
+    elif path == STOCK_FILE:
+        owner_index.invalidate()
+    net_worth.store_replaced(path, data)
+
+def adjust_balance(bank, user_id, delta, reason):
+    tx = current_tx.get()
+    if tx is not None and DATA_FILE in tx.data:
+        tx.touch(DATA_FILE, user_id)
+    user = bank[user_id]
+    user["bank_points"] += delta
+    row_changed(DATA_FILE, bank, user_id)
+    entry = {"store": DATA_FILE, "key": user_id, "delta": delta, "reason": reason, "balance": user["bank_points"]}
+    if tx is not None and DATA_FILE in tx.data:
+        tx.deltas.append(entry)
+    else:
+        state_journal.write(entry)
+
+async def checkpoint_journal():
+    async with checkpoint_lock:
+        if state_journal.pending is None:
+            state_journal.load()
+        # Günlükte kaydı olup henüz yüklenmemiş store'lar önce yüklensin
+        for path in list(state_journal.pending):
+            await read_json(path)
+        if state_journal.entries == 0 and not state_journal.segments() and not os.path.exists(LEGACY_JOURNAL_FILE):
+            return
+
+        seq = state_journal.rotate()
+        await asyncio.gather(*(store.writer.request(checkpoint=True) for store in list(stores.values())
+                               if store.dirty or store.journal_keys))
+        state_journal.drop_segments(seq)
+
+# Çok store'lu işlem: değiştirilecek satırlar touch() ile kaydedilir, hata olursa geri
+# alınır; başarılı olursa tüm satırlar tek bir günlük satırıyla birlikte commit edilir.
+current_tx = contextvars.ContextVar("current_tx", default=None)
+_MISSING = object()
+
+class Transaction:
+    def __init__(self, data):
+        self.data = data    # path -> store içeriği
+        self.saved = {}     # (path, key) -> değişiklikten önceki satır
+        self.deltas = []    # adjust_balance kayıtları
+        self.rollback_hooks = []  # geri almada çağrılır: işlem dışı bellek yapıları (yığınlar) için
+
+    def __getitem__(self, path):
+        return self.data[path]
+
+    def touch(self, path, *keys):
+        for key in keys:
+            key = str(key)
+            if (path, key) not in self.saved:
+                # Sentinel kopyalanmamalı, yoksa rollback yeni satırı tanıyamaz
+                row = self.data[path].get(key, _MISSING)
+                self.saved[(path, key)] = row if row is _MISSING else copy.deepcopy(row)
+
+    def on_rollback(self, func, *args):
+        self.rollback_hooks.append((func, args))
+
+    def rollback(self):
+        for (path, key), row in self.saved.items():
+            if row is _MISSING:
+                self.data[path].pop(key, None)
+            else:
+                self.data[path][key] = row
+            row_changed(path, self.data[path], key)
+        for func, args in self.rollback_hooks:
+            func(*args)
+        # Snapshot arka planda yazılırken yarım kalan işlemi görmüş olabilir,
+        # geri alınan satırlar günlüğe de yazılır ki tekrar oynatmada düzelsin
+        if self.saved:
+            entries = [{"store": path, "key": key, "row": self.data[path].get(key)} for path, key in self.saved]
+            state_journal.write({"reason": "rollback", "entries": entries})
+
+    def commit(self, reason):
+        if not self.saved:
+            return
+        entries = self.deltas + [{"store": path, "key": key, "row": self.data[path].get(key)}
+                                 for path, key in self.saved]
+        state_journal.write({"reason": reason, "entries": entries})
+        # İşlem içinde değişen satırlar bellekteki dizinlere de yansısın
+        for path, key in self.saved:
+            row_changed(path, self.data[path], key)
+        for path in self.data:
+            get_store(path).stats["writes"] += 1
+
+
+@asynccontextmanager
+async def transaction(*paths, reason="transaction"):
+    tx = Transaction({path: await read_json(path) for path in paths})
+    token = current_tx.set(tx)
+    try:
+        yield tx
+    except BaseException:
+        tx.rollback()
+        raise
+    else:
+        tx.commit(reason)
+    finally:
+        current_tx.reset(token)
+
+@tasks.loop(seconds=max(STATE_FLUSH_INTERVAL, 1))
+async def state_flush_loop():
+    await flush_all_stores()
+    if state_journal.entries >= JOURNAL_MAX_ENTRIES:
+        await checkpoint_journal()
+
+@tasks.loop(seconds=JOURNAL_COMPACT_INTERVAL)
+async def journal_compact_loop():
+    await checkpoint_journal()
+
+# Kullanıcı bazlı kilitler: komutlar okuma-değiştirme-yazma boyunca ilgili kullanıcıları
+# kilitler, birbirinden bağımsız kullanıcılar paralel ilerler. Birden fazla kullanıcı
+# her zaman sıralı kilitlenir, böylece pay/accept birbirini kilitleyemez.
+class UserLocks:
+    def __init__(self):
+        self.locks = {}  # user_id -> [lock, bekleyen/tutan sayısı]
+
+    @asynccontextmanager
+    async def hold(self, *user_ids):
+        keys = sorted({str(user_id) for user_id in user_ids if user_id is not None})
+        entries = []
+        for key in keys:
+            entry = self.locks.setdefault(key, [asyncio.Lock(), 0])
+            entry[1] += 1
+            entries.append((key, entry))
+
+        acquired = []
+        try:
+            for key, entry in entries:
+                await entry[0].acquire()
+                acquired.append(entry)
+            yield
+        finally:
+            for entry in acquired:
+                entry[0].release()
+            # Kimse kullanmıyorsa kilidi bırak, sözlük büyümesin
+            for key, entry in entries:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self.locks[key]
+
+
+user_locks = UserLocks()
 
 async def init_user(user_id):
     data = await read_json(DATA_FILE, data_lock)
@@ -63,22 +752,26 @@ async def init_user(user_id):
             "loan_amount": 0,
             "loan_timestamp": None
         }
-        await write_json(DATA_FILE, data, data_lock)
+        await write_json(DATA_FILE, data, data_lock, keys=[str(user_id)])
 
 async def take_loan(user_id, amount):
-    await init_user(user_id)
-    data = await read_json(DATA_FILE, data_lock)
-    user = data[str(user_id)]
+    async with user_locks.hold(user_id):
+        await init_user(user_id)
+        data = await read_json(DATA_FILE, data_lock)
+        user = data[str(user_id)]
 
-    if amount > user["bank_points"]:
-        return False, "You don't have enough bank points!"
+        if amount > user["bank_points"]:
+            return False, "You don't have enough bank points!"
 
-    user["loan_amount"] += amount
-    user["bank_points"] -= amount
-    user["loan_timestamp"] = time.time()
+        user["loan_amount"] += amount
+        adjust_balance(data, str(user_id), -amount, "loan")
+        user["loan_timestamp"] = time.time()
+        # Yeni kredi ceza takvimini baştan başlatır
+        user["loan_stage"] = 0
+        loan_schedule.push(str(user_id), user)
 
-    await write_json(DATA_FILE, data, data_lock)
-    return True, f"You borrowed ${amount}. You must repay it soon."
+        await write_json(DATA_FILE, data, data_lock, keys=[str(user_id)])
+        return True, f"You borrowed ${amount}. You must repay it soon."
 
 @bot.command()
 async def pay(ctx, member: discord.Member, amount: int):
@@ -91,98 +784,181 @@ async def pay(ctx, member: discord.Member, amount: int):
     if amount <= 0:
         return await ctx.send("❌ The amount to send must be positive.")
 
-    await init_user(sender_id)
-    await init_user(receiver_id)
+    async with user_locks.hold(sender_id, receiver_id):
+        await init_user(sender_id)
+        await init_user(receiver_id)
 
-    data = await read_json(DATA_FILE, data_lock)
+        data = await read_json(DATA_FILE, data_lock)
 
-    if data[sender_id]["bank_points"] < amount:
-        return await ctx.send("💸 You don't have enough money.")
+        if data[sender_id]["bank_points"] < amount:
+            return await ctx.send("💸 You don't have enough money.")
 
-    # Transfer money
-    data[sender_id]["bank_points"] -= amount
-    data[receiver_id]["bank_points"] += amount
+        # Transfer money
+        adjust_balance(data, sender_id, -amount, "pay")
+        adjust_balance(data, receiver_id, amount, "pay")
 
-    await write_json(DATA_FILE, data, data_lock)
+        await write_json(DATA_FILE, data, data_lock, keys=[sender_id, receiver_id])
 
-    await ctx.send(f"✅ {ctx.author.mention} sent **${amount}** to {member.mention}!")
+        await ctx.send(f"✅ {ctx.author.mention} sent **${amount}** to {member.mention}!")
 
 
 async def pay_loan(user_id, amount):
-    await init_user(user_id)
-    data = await read_json(DATA_FILE, data_lock)
-    user = data[str(user_id)]
-
-    if user["loan_amount"] <= 0:
-        return False, "You have no loan to pay!"
-
-    paid = min(amount, user["loan_amount"])
-    user["loan_amount"] -= paid
-    user["bank_points"] += paid
-
-    if user["loan_amount"] == 0:
-        user["loan_timestamp"] = None
-
-    await write_json(DATA_FILE, data, data_lock)
-    return True, f"You paid ${paid} from your loan."
+    async with user_locks.hold(user_id):
+        await init_user(user_id)
+        data = await read_json(DATA_FILE, data_lock)
+        user = data[str(user_id)]
+
+        if user["loan_amount"] <= 0:
+            return False, "You have no loan to pay!"
+
+        paid = min(amount, user["loan_amount"])
+        user["loan_amount"] -= paid
+        adjust_balance(data, str(user_id), paid, "loan_payment")
+
+        if user["loan_amount"] == 0:
+            # Takvimdeki kayıt geçersiz kalır, yığından çıkarken atlanır
+            user["loan_timestamp"] = None
+            user["loan_stage"] = 0
+
+        await write_json(DATA_FILE, data, data_lock, keys=[str(user_id)])
+        return True, f"You paid ${paid} from your loan."
+
+# Kredi cezaları: her aşama kredinin alınmasından LOAN_PENALTY_INTERVAL * aşama saniye
+# sonra bir kez uygulanır. Açık krediler bir sonraki ceza zamanına göre min-heap'te
+# durur, her tick sadece vadesi gelenler işlenir. Son aşamadan sonra kredi kapanır.
+LOAN_PENALTY_INTERVAL = 3600
+LOAN_PENALTY_STAGES = (0.25, 0.25, 0.25, 0.25)
+
+class LoanSchedule:
+    def __init__(self):
+        self.heap = []  # (vade, user_id, aşama)
+        self.loaded = False
+
+    def ensure_loaded(self, data, current_time):
+        # Açılışta yığın banka store'undaki açık kredilerden yeniden kurulur
+        if self.loaded:
+            return
+        self.loaded = True
+        for user_id, user in data.items():
+            if user.get("loan_amount", 0) > 0 and user.get("loan_timestamp") is not None:
+                if "loan_stage" not in user:
+                    # Eski kayıtlar: geçen saatlerin cezaları eski döngüde zaten kesilmişti
+                    tx = current_tx.get()
+                    if tx is not None:
+                        tx.touch(DATA_FILE, user_id)
+                    hours_passed = int((current_time - user["loan_timestamp"]) // LOAN_PENALTY_INTERVAL)
+                    user["loan_stage"] = min(hours_passed, len(LOAN_PENALTY_STAGES) - 1)
+                self.push(user_id, user)
+
+    def push(self, user_id, user):
+        stage = user.get("loan_stage", 0) + 1
+        deadline = user["loan_timestamp"] + stage * LOAN_PENALTY_INTERVAL
+        heapq.heappush(self.heap, (deadline, user_id, stage))
+
+    def reset(self):
+        # Yığın geri alınan satırlarla uyuşmaz hale geldi; sonraki tick banka store'undan yeniden kurar
+        self.heap = []
+        self.loaded = False
+
+    def pop_due(self, data, current_time):
+        # Kapanmış, yeniden alınmış ya da zaten uygulanmış aşamalar çıkarken atlanır
+        while self.heap and self.heap[0][0] <= current_time:
+            deadline, user_id, stage = heapq.heappop(self.heap)
+            user = data.get(user_id)
+            if (user is None or user.get("loan_amount", 0) <= 0 or user.get("loan_timestamp") is None
+                    or user.get("loan_stage", 0) != stage - 1
+                    or user["loan_timestamp"] + stage * LOAN_PENALTY_INTERVAL != deadline):
+                continue
+            yield user_id, user, stage
+
+
+loan_schedule = LoanSchedule()
+
+def apply_loan_penalties(data, current_time):
+    tx = current_tx.get()
+    if tx is not None:
+        tx.on_rollback(loan_schedule.reset)
+    loan_schedule.ensure_loaded(data, current_time)
+    changed = []
+    for user_id, user, stage in loan_schedule.pop_due(data, current_time):
+        if tx is not None:
+            tx.touch(DATA_FILE, user_id)
+
+        penalty = user["loan_amount"] * LOAN_PENALTY_STAGES[stage - 1]
+        user["loan_amount"] -= penalty
+        adjust_balance(data, user_id, -min(penalty, user["bank_points"]), "loan_penalty")
+        user["loan_stage"] = stage
+
+        if stage >= len(LOAN_PENALTY_STAGES):
+            user["loan_amount"] = 0
+            user["loan_timestamp"] = None
+            user["loan_stage"] = 0
+        else:
+            # Bir sonraki aşama; bot kapalıyken birden çok aşama geçtiyse bu tick içinde sırayla işlenir
+            loan_schedule.push(user_id, user)
+        changed.append(user_id)
 
-async def apply_loan_penalties():
-    data = await read_json(DATA_FILE, data_lock)
-    current_time = time.time()
+    return changed
 
-    changed = False
-    for user_id, user in data.items():
-        if user["loan_amount"] > 0 and user["loan_timestamp"] is not None:
-            hours_passed = int((current_time - user["loan_timestamp"]) // 3600)
-            if hours_passed > 0:
-                penalty_stages = [0.25, 0.25, 0.25, 0.25]
-                total_penalty = 0
-                reduced_debt = 0
-
-                for i in range(min(hours_passed, 4)):
-                    p = penalty_stages[i]
-                    amount = user["loan_amount"] * p
-                    total_penalty += amount
-                    reduced_debt += amount
-
-                user["loan_amount"] -= reduced_debt
-                user["bank_points"] = max(0, user["bank_points"] - total_penalty)
-
-                if hours_passed >= 4:
-                    user["loan_amount"] = 0
-                    user["loan_timestamp"] = None
-                changed = True
-
-    if changed:
-        await write_json(DATA_FILE, data, data_lock)
-
-@tasks.loop(hours=1)
-async def run_penalty_check():
-    await apply_loan_penalties()
-    print("Penalties applied.")
+COMPANY_CREATE_COST = 150000
+COMPANY_PRICE_MULTIPLIER = 1000  # hisse şirketi satın alma fiyatı: hisse değeri x1000
 
 async def create_company(user_id, name):
-    await init_user(user_id)
-    bank = await read_json(DATA_FILE, data_lock)
-    if bank[str(user_id)]["bank_points"] < 150000:
-        return False, "You don't have enough money to start a company."
-
-    companies = await read_json(COMPANY_FILE, company_lock)
-
-    if str(user_id) in companies:
-        return False, "You already own a company."
-
-    bank[str(user_id)]["bank_points"] -= 150000
-    companies[str(user_id)] = {
-        "company_name": name,
-        "office_level": 1,
-        "employees": []
-    }
+    async with user_locks.hold(user_id):
+        await init_user(user_id)
+        async with transaction(DATA_FILE, COMPANY_FILE, reason="create_company") as tx:
+            bank = tx[DATA_FILE]
+            if bank[str(user_id)]["bank_points"] < COMPANY_CREATE_COST:
+                return False, "You don't have enough money to start a company."
+
+            companies = tx[COMPANY_FILE]
+
+            if str(user_id) in companies:
+                return False, "You already own a company."
+
+            tx.touch(COMPANY_FILE, user_id)
+            adjust_balance(bank, str(user_id), -COMPANY_CREATE_COST, "create_company")
+            companies[str(user_id)] = {
+                "company_name": name,
+                "office_level": 1,
+                "employees": []
+            }
+            if INCOME_MODE == "accrual":
+                companies[str(user_id)]["last_settled"] = time.time()
+
+        return True, f"Company '{name}' created successfully!"
+
+# Çalışanlar tek tek değil {"level", "xp", "count"} kohortları olarak tutulur. Birlikte
+# işe alınanlar birlikte seviye atlar, bu yüzden şirket başına sadece birkaç kohort olur.
+def employee_count(company):
+    return sum(cohort["count"] for cohort in company.get("employees", []))
+
+def merge_cohorts(employees):
+    merged = {}
+    for cohort in employees:
+        key = (cohort.get("level", 1), cohort.get("xp", 0))
+        merged[key] = merged.get(key, 0) + cohort.get("count", 1)
+    return [{"level": level, "xp": xp, "count": count} for (level, xp), count in sorted(merged.items())]
+
+def add_employees(company, count, level=1, xp=0):
+    employees = company.setdefault("employees", [])
+    for cohort in employees:
+        if cohort["level"] == level and cohort["xp"] == xp:
+            cohort["count"] += count
+            return
+    employees.append({"level": level, "xp": xp, "count": count})
 
-    await write_json(DATA_FILE, bank, data_lock)
-    await write_json(COMPANY_FILE, companies, company_lock)
+def migrate_companies(companies):
+    # Eski biçim: her çalışan için ayrı {"level", "xp"} kaydı
+    changed = False
+    for company in companies.values():
+        employees = company.get("employees", [])
+        if any("count" not in cohort for cohort in employees):
+            company["employees"] = merge_cohorts(employees)
+            changed = True
+    return changed
 
-    return True, f"Company '{name}' created successfully!"
+STORE_MIGRATIONS = {COMPANY_FILE: migrate_companies}
 
 OFFICE_UPGRADES = {
     2: {"cost": 75000, "max_employees": 15},
@@ -194,62 +970,59 @@ OFFICE_UPGRADES = {
 }
 
 async def upgrade_office(user_id):
-    companies = await read_json(COMPANY_FILE, company_lock)
-    bank = await read_json(DATA_FILE, data_lock)
+    async with user_locks.hold(user_id), transaction(DATA_FILE, COMPANY_FILE, reason="upgrade_office") as tx:
+        companies = tx[COMPANY_FILE]
+        bank = tx[DATA_FILE]
 
-    if str(user_id) not in companies:
-        return False, "You don't own a company yet."
+        if str(user_id) not in companies:
+            return False, "You don't own a company yet."
 
-    company = companies[str(user_id)]
-    level = company["office_level"]
+        company = companies[str(user_id)]
+        level = company["office_level"]
 
-    if level >= 7:
-        return False, "You already have the max level office."
+        if level >= 7:
+            return False, "You already have the max level office."
 
-    next_level = level + 1
-    upgrade = OFFICE_UPGRADES[next_level]
+        next_level = level + 1
+        upgrade = OFFICE_UPGRADES[next_level]
 
-    if bank[str(user_id)]["bank_points"] < upgrade["cost"]:
-        return False, "Not enough funds to upgrade your office."
+        if bank[str(user_id)]["bank_points"] < upgrade["cost"]:
+            return False, "Not enough funds to upgrade your office."
 
-    bank[str(user_id)]["bank_points"] -= upgrade["cost"]
-    company["office_level"] = next_level
+        tx.touch(COMPANY_FILE, user_id)
+        adjust_balance(bank, str(user_id), -upgrade["cost"], "upgrade_office")
+        company["office_level"] = next_level
 
-    await write_json(DATA_FILE, bank, data_lock)
-    await write_json(COMPANY_FILE, companies, company_lock)
-
-    return True, f"Office upgraded to level {next_level}!"
+        return True, f"Office upgraded to level {next_level}!"
 
 async def hire_employee(user_id: str) -> tuple[bool, str]:
-    companies = await read_json(COMPANY_FILE, company_lock)
-    bank = await read_json(DATA_FILE, data_lock)
-
-    if user_id not in companies:
-        return False, "❌ You don't own a company yet."
+    async with user_locks.hold(user_id), transaction(DATA_FILE, COMPANY_FILE, reason="hire") as tx:
+        companies = tx[COMPANY_FILE]
+        bank = tx[DATA_FILE]
 
-    company = companies[user_id]
-    level = company.get("office_level", 1)
-    max_employees_list = [10, 15, 20, 30, 50, 75, 100]
-    max_employees = max_employees_list[min(level - 1, len(max_employees_list) - 1)]
+        if user_id not in companies:
+            return False, "❌ You don't own a company yet."
 
-    if len(company.get("employees", [])) >= max_employees:
-        return False, "🏢 Your office is full. Upgrade it to hire more employees."
+        company = companies[user_id]
+        level = company.get("office_level", 1)
+        max_employees_list = [10, 15, 20, 30, 50, 75, 100]
+        max_employees = max_employees_list[min(level - 1, len(max_employees_list) - 1)]
 
-    cost = 2000
-    if bank[user_id]["bank_points"] < cost:
-        return False, f"💸 Not enough money to hire. You need ${cost}."
+        if employee_count(company) >= max_employees:
+            return False, "🏢 Your office is full. Upgrade it to hire more employees."
 
-    # Düşür para
-    bank[user_id]["bank_points"] -= cost
+        cost = 2000
+        if bank[user_id]["bank_points"] < cost:
+            return False, f"💸 Not enough money to hire. You need ${cost}."
 
-    # Yeni çalışan ekle
-    company.setdefault("employees", []).append({"level": 1, "xp": 0})
+        # Düşür para
+        tx.touch(COMPANY_FILE, user_id)
+        adjust_balance(bank, user_id, -cost, "hire")
 
-    # JSON'lara yaz
-    await write_json(DATA_FILE, bank, data_lock)
-    await write_json(COMPANY_FILE, companies, company_lock)
+        # Yeni çalışan ekle
+        add_employees(company, 1)
 
-    return True, "👨‍💼 New employee hired successfully!"
+        return True, "👨‍💼 New employee hired successfully!"
 
 
 
@@ -257,79 +1030,246 @@ async def hire_employee(user_id: str) -> tuple[bool, str]:
 @bot.command()
 async def buycompany(ctx, *, company_name: str):
     user_id = str(ctx.author.id)
-    companies = await read_json("MAINStockMarket.json", asyncio.Lock())  # <--- BURAYA DİKKAT
-    bank = await read_json(DATA_FILE, data_lock)
-
-    # Normalize input (lowercase + underscore)
-    normalized_input = company_name.casefold().replace(" ", "_")
+    async with user_locks.hold(user_id), transaction(DATA_FILE, STOCK_FILE, reason="buy_company") as tx:
+        companies = tx[STOCK_FILE]
+        bank = tx[DATA_FILE]
 
-    matched_key = None
-    for key in companies:
-        normalized_key = key.casefold().replace(" ", "_")
-        if normalized_key == normalized_input:
-            matched_key = key
-            break
+        # Normalize input (lowercase + underscore)
+        normalized_input = company_name.casefold().replace(" ", "_")
 
-    if not matched_key:
-        return await ctx.send("❌ This company does not exist.")
+        matched_key = None
+        for key in companies:
+            normalized_key = key.casefold().replace(" ", "_")
+            if normalized_key == normalized_input:
+                matched_key = key
+                break
 
-    company = companies[matched_key]
-    price = company["stock_value"] * 1000
+        if not matched_key:
+            return await ctx.send("❌ This company does not exist.")
 
-    if company.get("owner") is not None:
-        return await ctx.send("❌ This company is already owned by someone else.")
+        company = companies[matched_key]
+        price = company["stock_value"] * COMPANY_PRICE_MULTIPLIER
 
-    if bank[user_id]["bank_points"] < price:
-        return await ctx.send(f"💸 You need ${price:,} to purchase this company.")
+        if company.get("owner") is not None:
+            return await ctx.send("❌ This company is already owned by someone else.")
 
-    bank[user_id]["bank_points"] -= price
-    company["owner"] = user_id
+        if bank[user_id]["bank_points"] < price:
+            return await ctx.send(f"💸 You need ${price:,} to purchase this company.")
 
-    await write_json(DATA_FILE, bank, data_lock)
-    await write_json("MAINStockMarket.json", companies, asyncio.Lock())  # <--- BURAYA DİKKAT
+        tx.touch(STOCK_FILE, matched_key)
+        adjust_balance(bank, user_id, -price, "buy_company")
+        company["owner"] = user_id
 
+    # Mesaj işlem dışında: gönderim hatası tamamlanmış satın almayı geri almasın
     await ctx.send(f"🏢 You successfully purchased **{matched_key}** for ${price:,}!")
 
 
 
 
 
-@tasks.loop(minutes=2)
-async def company_income_loop():
-    companies = await read_json("MAINStockMarket.json", asyncio.Lock())  # <- Doğru dosya
-    bank = await read_json(DATA_FILE, data_lock)
-
-    log_channel = bot.get_channel(1399484671288414208)  # Kanal ID doğru olmalı
-    if not log_channel:
-        return
+def ensure_account(bank, user_id):
+    # Kullanıcı kaydı yoksa oluştur
+    if user_id not in bank:
+        current_tx.get().touch(DATA_FILE, user_id)
+        bank[user_id] = {
+            "bank_points": 0,
+            "loan_amount": 0,
+            "loan_timestamp": None
+        }
 
+def pay_stock_owner_income(bank, market):
     summary = []
-
-    for name, info in companies.items():
+    for name, info in market.items():
         owner_id = info.get("owner")
         if owner_id:
             income = info["stock_value"] * 50  # Hisse değeri x50 kazanç
             owner_id = str(owner_id)
 
-            # Kullanıcı kaydı yoksa oluştur
-            if owner_id not in bank:
-                bank[owner_id] = {
-                    "bank_points": 0,
-                    "wallet_points": 0
-                }
-
-            bank[owner_id]["bank_points"] += income
+            ensure_account(bank, owner_id)
+            adjust_balance(bank, owner_id, income, "company_income")
             summary.append(f"🏢 **{name.title()}** → <@{owner_id}> earned **${income:,}**")
+    return summary
 
-    await write_json(DATA_FILE, bank, data_lock)
-
+async def post_owner_income_report(channel, summary):
     if summary:
         embed = discord.Embed(
             title="💰 Company Income Report",
             description="\n".join(summary),
             color=0x00ff99
         )
-        await log_channel.send(embed=embed)
+        await channel.send(embed=embed)
+
+# Gelir modu: "push" (varsayılan) her tick'te tüm sahiplerin bakiyesine yazar ve gelir
+# raporunu kanala atar. "accrual" (INCOME_MODE=accrual) geliri biriktirir ve kullanıcı bir
+# komut çalıştırdığında ya da liderlik tablosundan önce kapalı formda öder; boştaki oyuncular
+# tick'e maliyet getirmez. Bu modda şirket gelir raporu gönderilmez, çevrimdışıyken de birikir.
+#   şirketler: "last_settled" zamanından bu yana geçen tick sayısı kadar çalışan
+#              kohortları ilerletilir (gelir + XP), bkz. progress_cohort
+#   hisse şirketi sahipleri: her hissenin birikimli "income_index" değeri tick'te
+#              artar, sahip son ödemedeki değerle ("owner_settled") farkı alır
+INCOME_MODE = os.getenv("INCOME_MODE", "push").lower()
+accrual_state = {"started": False, "drained": False}
+
+def start_accrual(companies, now):
+    # Bu modda ilk tick: last_settled'ı olmayan şirketler şimdiden biriktirmeye başlar
+    if accrual_state["started"]:
+        return False
+    accrual_state["started"] = True
+    changed = False
+    for company in companies.values():
+        if "last_settled" not in company:
+            company["last_settled"] = now
+            changed = True
+    return changed
+
+def accrue_owner_income(market):
+    summary = []
+    for name, info in market.items():
+        income = info["stock_value"] * 50  # Hisse değeri x50 kazanç
+        owner_id = info.get("owner")
+        if owner_id and "owner_settled" not in info:
+            info["owner_settled"] = info.get("income_index", 0)
+        info["income_index"] = info.get("income_index", 0) + income
+        if owner_id:
+            summary.append(f"🏢 **{name.title()}** → <@{owner_id}> accrued **${income:,}**")
+    return summary
+
+def settle_income(tx, user_id, now):
+    bank, companies, market = tx[DATA_FILE], tx[COMPANY_FILE], tx[STOCK_FILE]
+    income = 0
+
+    company = companies.get(user_id)
+    if company is not None and "last_settled" in company:
+        tx.touch(COMPANY_FILE, user_id)
+        ticks = int((now - company["last_settled"]) // (ECONOMY_TICK_MINUTES * 60))
+        if ticks > 0:
+            company["last_settled"] += ticks * ECONOMY_TICK_MINUTES * 60
+            income += sum(progress_cohort(cohort, ticks) for cohort in company["employees"])
+            company["employees"] = merge_cohorts(company["employees"])
+        if INCOME_MODE != "accrual":
+            del company["last_settled"]
+
+    owner_index.ensure(market)
+    for name in list(owner_index.stocks.get(user_id, ())):
+        info = market[name]
+        if "owner_settled" in info:
+            tx.touch(STOCK_FILE, name)
+            income += info.get("income_index", 0) - info["owner_settled"]
+            info["owner_settled"] = info.get("income_index", 0)
+            if INCOME_MODE != "accrual":
+                del info["owner_settled"]
+
+    pending_cache.settled(user_id)
+    tx.on_rollback(pending_cache.invalidate)
+    if income:
+        ensure_account(bank, user_id)
+        adjust_balance(bank, user_id, income, "company_income")
+    return income
+
+def due_users(companies, market, user_ids, now):
+    # user_ids None ise biriken geliri olan herkes (liderlik tablosu, mod değişimi)
+    accrual = INCOME_MODE == "accrual"
+    tick_seconds = ECONOMY_TICK_MINUTES * 60
+    owner_index.ensure(market)
+
+    def due(user_id):
+        company = companies.get(user_id)
+        if company is not None and "last_settled" in company:
+            if not accrual or now - company["last_settled"] >= tick_seconds:
+                return True
+        for name in owner_index.stocks.get(user_id, ()):
+            info = market[name]
+            if "owner_settled" in info and (not accrual or info.get("income_index", 0) > info["owner_settled"]):
+                return True
+        return False
+
+    candidates = set(owner_index.stocks).union(companies) if user_ids is None else user_ids
+    return [user_id for user_id in candidates if due(user_id)]
+
+async def settle_users(user_ids=None):
+    now = time.time()
+    companies = await read_json(COMPANY_FILE, company_lock)
+    market = await read_json(STOCK_FILE, stock_lock)
+    users = due_users(companies, market, user_ids, now)
+    if not users:
+        return 0
+
+    total = 0
+    async with user_locks.hold(*users), transaction(DATA_FILE, COMPANY_FILE, STOCK_FILE, reason="settle_income") as tx:
+        for user_id in users:
+            total += settle_income(tx, user_id, now)
+    return total
+
+def pending_income(companies, market, now):
+    # Ödenmemiş birikimler: user_id -> tutar. Store'lara dokunmaz; kohortlar kopyada ilerletilir
+    tick_seconds = ECONOMY_TICK_MINUTES * 60
+    pending = {}
+    for user_id, company in companies.items():
+        if "last_settled" in company:
+            ticks = int((now - company["last_settled"]) // tick_seconds)
+            if ticks > 0:
+                pending[user_id] = sum(progress_cohort(dict(cohort), ticks) for cohort in company["employees"])
+    for info in market.values():
+        if info.get("owner") and "owner_settled" in info:
+            amount = info.get("income_index", 0) - info["owner_settled"]
+            if amount > 0:
+                owner_id = str(info["owner"])
+                pending[owner_id] = pending.get(owner_id, 0) + amount
+    return pending
+
+# Birikim önbelleği: pending_income tüm şirketleri ve hisseleri tarar, bu yüzden fiyat dönemi
+# (tick) başına en fazla bir kez, ilk liderlik tablosunda hesaplanır. Ödenen kullanıcı önbellekten
+# düşer. Dönem içinde bir şirketin tamamladığı tick sonraki dönemde görünür; ödeme yine tamdır.
+class PendingCache:
+    def __init__(self):
+        self.epoch = None
+        self.pending = {}  # user_id -> birikim
+        self.order = []    # (user_id, birikim), birikime göre azalan
+
+    def get(self, companies, market):
+        if self.epoch != tick_engine.epoch:
+            self.epoch = tick_engine.epoch
+            self.pending = pending_income(companies, market, time.time())
+            self.order = sorted(self.pending.items(), key=lambda item: -item[1])
+        return self.pending
+
+    def settled(self, user_id):
+        self.pending.pop(user_id, None)
+
+    def invalidate(self):
+        self.epoch = None
+
+
+pending_cache = PendingCache()
+
+async def settle_leaders(ranking, k):
+    # Liderlik tablosu için herkes ödenmez: sıralamadaki skor + birikim ile ilk k'ya girebilecek
+    # kullanıcılar ödenir. Birikimler büyükten küçüğe gezilir; ilk k dışındakilerin skoru en fazla
+    # k+1'inci skordur, bu sınırla giremeyecek birikime gelince durulur.
+    companies = await read_json(COMPANY_FILE, company_lock)
+    market = await read_json(STOCK_FILE, stock_lock)
+    pending = pending_cache.get(companies, market)
+    if not pending:
+        return 0
+    scores = ranking.scores
+    top = ranking.top(k + 1)
+    outside = max(scores[top[k]], 0) if len(top) > k else 0
+
+    leaders = [(scores[user_id] + pending.get(user_id, 0), user_id) for user_id in top[:k]]
+    heapq.heapify(leaders)
+    seen = set(top[:k])
+    for user_id, _ in pending_cache.order:
+        amount = pending.get(user_id)
+        if amount is None or user_id in seen:
+            continue
+        if len(leaders) >= k and amount + outside <= leaders[0][0]:
+            break
+        entry = (scores.get(user_id, 0) + amount, user_id)
+        if len(leaders) < k:
+            heapq.heappush(leaders, entry)
+        elif entry > leaders[0]:
+            heapq.heapreplace(leaders, entry)
+    return await settle_users([user_id for _, user_id in leaders if user_id in pending])
 
 
 
@@ -339,73 +1279,367 @@ async def buy_stock(user_id, stock_name, amount: int):
     if amount <= 0:
         return False, "Please enter a valid amount of shares to buy."
 
-    market = await read_json(STOCK_FILE, stock_lock)
-    bank = await read_json(DATA_FILE, data_lock)
+    async with user_locks.hold(user_id), transaction(DATA_FILE, USER_STOCK_FILE, reason="buy_stock") as tx:
+        market = await read_json(STOCK_FILE, stock_lock)
+        bank = tx[DATA_FILE]
 
-    if stock_name not in market:
-        return False, "That stock doesn't exist."
+        if stock_name not in market:
+            return False, "That stock doesn't exist."
 
-    stock_price = market[stock_name]["stock_value"]  # hisse başı fiyat
-    cost = stock_price * amount  # toplam maliyet
+        stock_price = market[stock_name]["stock_value"]  # hisse başı fiyat
+        cost = stock_price * amount  # toplam maliyet
 
-    user_id_str = str(user_id)
+        user_id_str = str(user_id)
 
-    if bank[user_id_str]["bank_points"] < cost:
-        return False, f"You can't afford {amount} shares of {stock_name} (cost: ${cost})."
+        if bank[user_id_str]["bank_points"] < cost:
+            return False, f"You can't afford {amount} shares of {stock_name} (cost: ${cost})."
 
-    userstocks = await read_json(USER_STOCK_FILE, user_stock_lock)
+        userstocks = tx[USER_STOCK_FILE]
+        tx.touch(USER_STOCK_FILE, user_id_str)
 
-    if user_id_str not in userstocks:
-        userstocks[user_id_str] = {}
+        if user_id_str not in userstocks:
+            userstocks[user_id_str] = {}
 
-    # Kullanıcı zaten bu hisseden varsa miktarı artır, yoksa yeni kayıt oluştur
-    if stock_name in userstocks[user_id_str]:
-        userstocks[user_id_str][stock_name] += amount
-    else:
-        userstocks[user_id_str][stock_name] = amount
-
-    bank[user_id_str]["bank_points"] -= cost
+        # Kullanıcı zaten bu hisseden varsa miktarı artır, yoksa yeni kayıt oluştur
+        if stock_name in userstocks[user_id_str]:
+            userstocks[user_id_str][stock_name] += amount
+        else:
+            userstocks[user_id_str][stock_name] = amount
 
-    await write_json(DATA_FILE, bank, data_lock)
-    await write_json(USER_STOCK_FILE, userstocks, user_stock_lock)
+        adjust_balance(bank, user_id_str, -cost, "buy_stock")
+        tick_engine.add_flow(stock_name, amount)
 
-    return True, f"You bought {amount} shares of {stock_name} for ${cost}."
+        return True, f"You bought {amount} shares of {stock_name} for ${cost}."
 
 import random
 
-def update_stock_values_sync(market):
- 
-    for name, data in market.items():
-        change_percent = random.uniform(-25, 25)  # -5% to +10%
-        original = data["stock_value"]
-        new_value = round(original * (1 + change_percent / 100))
-        market[name]["stock_value"] = max(100, new_value)
-    return market
-
-async def update_stock_values():
-    async with stock_lock:
-        async with aiofiles.open(STOCK_FILE, 'r') as f:
-            content = await f.read()
-            market = json.loads(content) if content else {}
-
-        for name, data in market.items():
-            old_value = data.get("stock_value", 1000)
-            change_percent = random.uniform(-25, 25)  # -5% to +10%
-            new_value = round(old_value * (1 + change_percent / 100))
-            new_value = max(100, new_value)
+# Fiyat motoru: tüm piyasanın fiyatları tek bir NumPy dizisinde tutulur, her tick'te
+# bütün hisselerin hareketi tek adımda hesaplanır ve sonuç toplu olarak yazılır.
+# Her hisse MAINStockMarket.json içinde kendi modelini seçebilir:
+#   "model": "uniform"         her tick ±%25 düz rastgele (eski davranış)
+#   "model": "gbm"             geometrik Brown hareketi: "drift", "volatility"
+#   "model": "mean_reversion"  log fiyat "mean" değerine "reversion" hızıyla çekilir
+#   "model": "sector"          "sector" alanındaki sektörle ilişkili GBM
+# "sector" alanı olan her gbm/mean_reversion hissesi de sektör şokunu "sector_weight" oranında paylaşır.
+# İki tick arasındaki net alım/satım (order flow) fiyatı karekök etki yasasıyla iter:
+# etki = IMPACT_COEFFICIENT * sign(net) * sqrt(|net| / depth), "depth" hisse başına ayarlanabilir.
+MIN_STOCK_VALUE = 100
+IMPACT_COEFFICIENT = float(os.getenv("IMPACT_COEFFICIENT", "0.1"))
+MARKET_DEPTH = float(os.getenv("MARKET_DEPTH", "10000"))  # hisse; bu kadar net alım ~%10 iter
+MAX_IMPACT = 0.5  # tek tick'te log fiyat en fazla bu kadar itilir
+PRICE_MODEL = os.getenv("PRICE_MODEL", "uniform")  # modeli belirtilmemiş hisseler için
+SECTOR_CORRELATION = float(os.getenv("SECTOR_CORRELATION", "0.3"))  # farklı sektörler arası korelasyon
+DEFAULT_VOLATILITY = 0.1
+
+class TickEngine:
+    def __init__(self):
+        self.names = []
+        self.index = {}
+        self.prices = np.zeros(0, dtype=np.int64)
+        self.rng = np.random.default_rng()
+        self.flow = {}       # hisse -> son tick'ten beri net alınan hisse (satış negatif)
+        self.last_flow = {}  # hisse -> (net, fiyat etkisi) son tick'te uygulanan
+        self.epoch = 0       # fiyat dönemi: her tick'te artar, fiyata bağlı önbellekler anahtar olarak kullanır
+
+    def add_flow(self, stock, shares):
+        self.flow[stock] = self.flow.get(stock, 0) + shares
+
+    def sync(self, market):
+        # Hisse listesi değiştiyse diziler ve model parametreleri store'dan yeniden kurulur
+        if market.keys() == set(self.names):
+            return
+        self.names = list(market)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        rows = [market[name] for name in self.names]
+        models = []
+        for name, row in zip(self.names, rows):
+            model = row.get("model", PRICE_MODEL)
+            if model not in ("uniform", "gbm", "mean_reversion", "sector"):
+                print(f"[market] unknown price model {model!r} for {name}, using uniform")
+                model = "uniform"
+            models.append(model)
+
+        self.prices = np.array([row.get("stock_value", 1000) for row in rows], dtype=np.int64)
+        self.uniform = np.array([model == "uniform" for model in models])
+        self.reverting = np.array([model == "mean_reversion" for model in models])
+        self.drift = np.array([row.get("drift", 0.0) for row in rows], dtype=np.float64)
+        self.volatility = np.array([row.get("volatility", DEFAULT_VOLATILITY) for row in rows], dtype=np.float64)
+        self.reversion = np.array([row.get("reversion", 0.1) for row in rows], dtype=np.float64)
+        self.depth = np.array([row.get("depth", MARKET_DEPTH) for row in rows], dtype=np.float64)
+        self.log_mean = np.log(np.array([row.get("mean", row.get("stock_value", 1000)) for row in rows], dtype=np.float64))
+
+        # Sektör şokları: sektörler arası korelasyon matrisi Cholesky ile ayrıştırılır,
+        # her hisse kendi sektörünün şokunu ve kendine özgü bir şoku karıştırır
+        sectors = [None if model == "uniform" else row.get("sector", "market" if model == "sector" else None)
+                   for row, model in zip(rows, models)]
+        self.sector_names = sorted({sector for sector in sectors if sector})
+        positions = {sector: i for i, sector in enumerate(self.sector_names)}
+        self.sector_index = np.array([positions.get(sector, -1) for sector in sectors], dtype=np.int64)
+        self.sector_weight = np.clip(np.array([row.get("sector_weight", 0.6) if sector else 0.0
+                                               for row, sector in zip(rows, sectors)], dtype=np.float64), 0, 1)
+        correlation = np.full((len(self.sector_names), len(self.sector_names)), SECTOR_CORRELATION)
+        np.fill_diagonal(correlation, 1.0)
+        self.sector_cholesky = np.linalg.cholesky(correlation) if self.sector_names else None
+
+    def shocks(self):
+        z = self.rng.standard_normal(len(self.names))
+        if self.sector_cholesky is None:
+            return z
+        factors = self.sector_cholesky @ self.rng.standard_normal(len(self.sector_names))
+        sector_z = factors[np.maximum(self.sector_index, 0)]
+        mixed = np.sqrt(self.sector_weight) * sector_z + np.sqrt(1 - self.sector_weight) * z
+        return np.where(self.sector_index >= 0, mixed, z)
+
+    def tick(self, market):
+        self.sync(market)
+        prices = self.prices.astype(np.float64)
+        log_prices = np.log(prices)
+        z = self.shocks()
+
+        # GBM: log getiri = (drift - volatility²/2) + volatility * z
+        gbm = log_prices + self.drift - self.volatility ** 2 / 2 + self.volatility * z
+        # Ortalamaya dönüş (log fiyatta Ornstein-Uhlenbeck)
+        reverting = log_prices + self.reversion * (self.log_mean - log_prices) + self.volatility * z
+        new_prices = np.exp(np.where(self.reverting, reverting, gbm))
+        uniform = prices * (1 + self.rng.uniform(-25, 25, len(self.names)) / 100)
+        new_prices = np.where(self.uniform, uniform, new_prices)
+
+        # Piyasa etkisi: sadece işlem gören hisseler için net akış vektörü kurulur
+        flow, self.flow = self.flow, {}
+        flow = {name: shares for name, shares in flow.items() if name in self.index and shares}
+        if flow:
+            net = np.zeros(len(self.names))
+            rows = np.fromiter((self.index[name] for name in flow), dtype=np.int64, count=len(flow))
+            net[rows] = list(flow.values())
+            impact = np.clip(IMPACT_COEFFICIENT * np.sign(net) * np.sqrt(np.abs(net) / self.depth), -MAX_IMPACT, MAX_IMPACT)
+            new_prices = new_prices * np.exp(impact)
+            self.last_flow = {name: (shares, float(np.expm1(impact[row])))
+                              for (name, shares), row in zip(flow.items(), rows.tolist())}
+        else:
+            self.last_flow = {}
+        new_prices = np.maximum(MIN_STOCK_VALUE, np.rint(new_prices)).astype(np.int64)
+
+        for name, old_value, new_value in zip(self.names, self.prices.tolist(), new_prices.tolist()):
+            row = market[name]
+            row["previous_value"] = old_value
+            row["stock_value"] = new_value
+        self.prices = new_prices
+        self.epoch += 1
+
+
+tick_engine = TickEngine()
+
+# Fiyat geçmişi: sabit boyutlu halka tampon. Tüm hisseler tek bir zaman damgası halkasını
+# paylaşır, fiyatlar (hisse sayısı x kapasite) bir matriste durur. Dosyaya sıkıştırılmış
+# .npz olarak yazılır; mum grafikleri (OHLC) istendiğinde bu diziden hesaplanır.
+HISTORY_FILE = "MAINPriceHistory.npz"
+HISTORY_CAPACITY = int(os.getenv("HISTORY_CAPACITY", "2160"))  # 2 dakikalık tick ile 3 gün
+HISTORY_SAVE_EVERY = int(os.getenv("HISTORY_SAVE_EVERY", "5"))  # kaç tick'te bir diske yazılır
+CANDLE_INTERVALS = {"1h": 3600, "1d": 86400}
+
+class PriceHistory:
+    def __init__(self, path, capacity):
+        self.path = path
+        self.capacity = capacity
+        self.names = []
+        self.index = {}
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.prices = np.zeros((0, capacity), dtype=np.int32)  # 0 = o tick'te kayıt yok
+        self.head = 0   # sıradaki yazma konumu
+        self.count = 0
+        self.loaded = False
+        self.unsaved = 0
+
+    def load(self):
+        self.loaded = True
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as saved:
+                names = [str(name) for name in saved["names"]]
+                timestamps, prices = saved["timestamps"], saved["prices"]
+                count = int(saved["count"])
+                head = int(saved["head"])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[history] could not read {self.path}, starting empty: {e}")
+            return
+        # Kronolojik sıraya çevir, kapasite değiştiyse son kayıtları koru
+        order = (np.arange(head - count, head)) % len(timestamps)
+        order = order[-self.capacity:]
+        self.count = len(order)
+        self.head = self.count % self.capacity
+        self.timestamps[:self.count] = timestamps[order]
+        self.names = names
+        self.index = {name: i for i, name in enumerate(names)}
+        self.prices = np.zeros((len(names), self.capacity), dtype=np.int32)
+        self.prices[:, :self.count] = prices[:, order]
+
+    def record(self, names, prices, timestamp):
+        if not self.loaded:
+            self.load()
+        if names != self.names:
+            new_names = [name for name in names if name not in self.index]
+            if new_names:
+                for name in new_names:
+                    self.index[name] = len(self.names)
+                    self.names.append(name)
+                self.prices = np.vstack([self.prices, np.zeros((len(new_names), self.capacity), dtype=np.int32)])
+            rows = np.array([self.index[name] for name in names], dtype=np.int64)
+            self.prices[:, self.head] = 0
+            self.prices[rows, self.head] = np.minimum(prices, np.iinfo(np.int32).max)
+        else:
+            self.prices[:, self.head] = np.minimum(prices, np.iinfo(np.int32).max)
+        self.timestamps[self.head] = timestamp
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.unsaved += 1
+
+    def lookup(self, stock_name):
+        # buycompany ile aynı eşleştirme: büyük/küçük harf ve boşluk/alt çizgi farkı yok sayılır
+        if not self.loaded:
+            self.load()
+        normalized = stock_name.casefold().replace(" ", "_")
+        return next((name for name in self.names if name.casefold().replace(" ", "_") == normalized), None)
+
+    def series(self, name):
+        if not self.loaded:
+            self.load()
+        if name not in self.index:
+            return np.zeros(0), np.zeros(0, dtype=np.int32)
+        order = np.arange(self.head - self.count, self.head) % self.capacity
+        timestamps = self.timestamps[order]
+        prices = self.prices[self.index[name], order]
+        present = prices > 0
+        return timestamps[present], prices[present]
+
+    def candles(self, name, interval):
+        # Aynı zaman aralığına düşen tick'ler tek mumda birleşir: open, high, low, close
+        timestamps, prices = self.series(name)
+        if not len(prices):
+            return []
+        buckets = (timestamps // interval).astype(np.int64)
+        starts = np.flatnonzero(np.diff(buckets, prepend=buckets[0] - 1))
+        ends = np.append(starts[1:], len(prices)) - 1
+        highs = np.maximum.reduceat(prices, starts)
+        lows = np.minimum.reduceat(prices, starts)
+        return [
+            {"time": int(buckets[start] * interval), "open": int(prices[start]), "high": int(high),
+             "low": int(low), "close": int(prices[end])}
+            for start, end, high, low in zip(starts.tolist(), ends.tolist(), highs.tolist(), lows.tolist())
+        ]
+
+    def snapshot(self):
+        return {"names": np.array(self.names), "timestamps": self.timestamps.copy(),
+                "prices": self.prices.copy(), "head": self.head, "count": self.count}
+
+    async def save(self):
+        if not self.unsaved:
+            return
+        self.unsaved = 0
+        await asyncio.to_thread(write_npz, self.path, self.snapshot())
+
+
+def write_npz(path, arrays):
+    # atomic_write ile aynı: geçici dosya, fsync, tek adımda yerine koy
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+price_history = PriceHistory(HISTORY_FILE, HISTORY_CAPACITY)
+
+
+# Kullanıcı adı çözümleyici: LRU + TTL önbellek, en fazla NAME_CACHE_SIZE kayıt. Sunucu
+# üyesi varsa takma adı doğrudan kullanılır; yoksa önbellek, sonra bot'un kendi önbelleği,
+# en son REST denenir. Eksikler tek seferde, sınırlı eşzamanlılıkla çekilir. Silinmiş
+# hesaplar (NotFound) NAME_NEGATIVE_TTL boyunca negatif kayıt olarak tutulur; geçici
+# HTTP hataları önbelleğe yazılmaz.
+NAME_CACHE_SIZE = int(os.getenv("NAME_CACHE_SIZE", "10000"))
+NAME_CACHE_TTL = float(os.getenv("NAME_CACHE_TTL", "3600"))
+NAME_NEGATIVE_TTL = float(os.getenv("NAME_NEGATIVE_TTL", "600"))
+NAME_FETCH_CONCURRENCY = 5
+
+class NameResolver:
+    def __init__(self, size, ttl, negative_ttl):
+        self.size = size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.entries = OrderedDict()  # user_id -> (ad ya da None, son geçerlilik)
+        self.fetch_limit = asyncio.Semaphore(NAME_FETCH_CONCURRENCY)
+
+    def get(self, user_id):
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return _MISSING
+        name, expires = entry
+        if expires < time.monotonic():
+            del self.entries[user_id]
+            return _MISSING
+        self.entries.move_to_end(user_id)
+        return name
+
+    def put(self, user_id, name):
+        ttl = self.ttl if name is not None else self.negative_ttl
+        self.entries[user_id] = (name, time.monotonic() + ttl)
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    async def fetch(self, user_id):
+        async with self.fetch_limit:
+            try:
+                user = await bot.fetch_user(int(user_id))
+            except discord.NotFound:
+                self.put(user_id, None)
+                return
+            except discord.HTTPException:
+                return
+        self.put(user_id, user.name)
+
+    async def prefetch(self, user_ids):
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            if self.get(user_id) is not _MISSING:
+                continue
+            user = bot.get_user(int(user_id))
+            if user is not None:
+                self.put(user_id, user.name)
+            else:
+                missing.append(user_id)
+        await asyncio.gather(*(self.fetch(user_id) for user_id in missing))
+
+    async def names(self, user_ids, guild=None):
+        # user_id -> ad; çözülemeyenler None
+        names = {}
+        rest = []
+        for user_id in user_ids:
+            member = guild.get_member(int(user_id)) if guild is not None else None
+            if member is not None:
+                names[user_id] = member.display_name
+            else:
+                rest.append(user_id)
+        await self.prefetch(rest)
+        for user_id in rest:
+            name = self.get(user_id)
+            names[user_id] = None if name is _MISSING else name
+        return names
 
-            data["previous_value"] = old_value
-            data["stock_value"] = new_value
 
-        async with aiofiles.open(STOCK_FILE, 'w') as f:
-            await f.write(json.dumps(market, indent=4))
+name_resolver = NameResolver(NAME_CACHE_SIZE, NAME_CACHE_TTL, NAME_NEGATIVE_TTL)
 
 @bot.command()
 async def leaderstats(ctx):
     data = await read_json(DATA_FILE, data_lock)
+    if INCOME_MODE == "accrual":
+        rank_index.ensure(data)
+        await settle_leaders(rank_index.ranking, 20)
 
-    # Kullanıcıları bank_points'e göre sırala
-    sorted_users = sorted(data.items(), key=lambda x: x[1].get("bank_points", 0), reverse=True)
+    # İlk 20 sıralama dizininden gelir, isimler tek seferde çözülür
+    top_users = rank_index.top(data, 20)
+    names = await name_resolver.names(top_users)
 
     embed = discord.Embed(
         title="💰 Leaderboard - Richest Players",
@@ -413,18 +1647,295 @@ async def leaderstats(ctx):
         color=0xf1c40f
     )
 
-    for i, (user_id, user_data) in enumerate(sorted_users[:20], start=1):
-        user = await bot.fetch_user(int(user_id))
-        username = user.name if user else f"User {user_id}"
-        balance = user_data.get("bank_points", 0)
+    for i, user_id in enumerate(top_users, start=1):
+        balance = data[user_id].get("bank_points", 0)
+        username = names[user_id] or f"User {user_id}"
         embed.add_field(name=f"#{i} - {username}", value=f"${balance}", inline=False)
 
     await ctx.send(embed=embed)
 
 
+# Hisse -> {user_id: adet} ters dizini ve hisse başına dolaşımdaki toplam adet.
+# MAINUserStocks.json kullanıcıya göre tutulur; "bu hisseyi kim tutuyor" sorusu tüm
+# kullanıcıları taramadan buradan cevaplanır. İlk kullanımda kurulur, sonra değişen
+# satırlar (row_changed) tek tek işlenir.
+class HolderIndex:
+    def __init__(self):
+        self.data = None       # dizinin kurulduğu hisse store'u
+        self.holders = {}      # hisse -> {user_id: adet}
+        self.positions = {}    # user_id -> {hisse: adet}
+        self.outstanding = {}  # hisse -> toplam adet
+
+    def ensure(self, data):
+        if self.data is data:
+            return
+        self.data = data
+        self.holders, self.positions, self.outstanding = {}, {}, {}
+        for user_id, row in data.items():
+            self.set_positions(user_id, row)
+
+    def set_positions(self, user_id, row):
+        for stock, shares in self.positions.pop(user_id, {}).items():
+            del self.holders[stock][user_id]
+            self.outstanding[stock] -= shares
+        positions = {stock: shares for stock, shares in (row or {}).items() if shares}
+        for stock, shares in positions.items():
+            self.holders.setdefault(stock, {})[user_id] = shares
+            self.outstanding[stock] = self.outstanding.get(stock, 0) + shares
+        if positions:
+            self.positions[user_id] = positions
+
+    def update(self, data, user_id):
+        if self.data is data:
+            self.set_positions(user_id, data.get(user_id))
+
+    def invalidate(self):
+        self.data = None
+
+    def market_cap(self, stock, price):
+        return self.outstanding.get(stock, 0) * price
+
+
+holder_index = HolderIndex()
+
+# Sahip -> {hisse} dizini: gelir ödemesi bir kullanıcının şirketlerini tüm piyasayı
+# taramadan bulur. Fiyat tick'inin anahtarsız yazması dizini yeniden kurdurur.
+class OwnerIndex:
+    def __init__(self):
+        self.data = None   # dizinin kurulduğu piyasa store'u
+        self.stocks = {}   # user_id -> {hisse}
+        self.owner = {}    # hisse -> user_id
+
+    def ensure(self, data):
+        if self.data is data:
+            return
+        self.data = data
+        self.stocks, self.owner = {}, {}
+        for name in data:
+            self.set_owner(name, data[name])
+
+    def set_owner(self, name, info):
+        old = self.owner.pop(name, None)
+        if old is not None:
+            self.stocks[old].discard(name)
+            if not self.stocks[old]:
+                del self.stocks[old]
+        if info and info.get("owner"):
+            owner_id = str(info["owner"])
+            self.owner[name] = owner_id
+            self.stocks.setdefault(owner_id, set()).add(name)
+
+    def update(self, data, name):
+        if self.data is data:
+            self.set_owner(name, data.get(name))
+
+    def invalidate(self):
+        self.data = None
+
+
+owner_index = OwnerIndex()
+
+# Net değer: nakit (bakiye - kredi) + hisseler (adet x fiyat) + sahip olunan hisse şirketleri
+# (satın alma fiyatı) + ofis (kuruluş ve yükseltme maliyetleri). Açık emirlerde emanette duran
+# para nakde, hisseler güncel fiyatla hisselere sayılır. Dizin ilk !networth'te dört
+# store'dan kurulur; sonra row_changed/store_replaced ile sadece etkilenen kullanıcılar yeniden
+# değerlenir. Fiyat değişince holder_index'ten sadece o hissenin sahipleri bulunur, tüm
+# kullanıcı x hisse çarpımı taranmaz.
+NET_WORTH_STORES = (DATA_FILE, USER_STOCK_FILE, STOCK_FILE, COMPANY_FILE, ORDER_FILE)
+
+def office_value(company):
+    level = company.get("office_level", 1)
+    return COMPANY_CREATE_COST + sum(OFFICE_UPGRADES[lvl]["cost"] for lvl in range(2, level + 1))
+
+class NetWorthIndex:
+    def __init__(self):
+        self.sources = {}    # path -> dizinin kurulduğu store sözlüğü
+        self.prices = {}     # hisse -> dizindeki fiyat
+        self.owners = {}     # hisse -> sahip user_id
+        self.cash = {}       # user_id -> bakiye - kredi
+        self.holdings = {}   # user_id -> hisselerin değeri
+        self.assets = {}     # user_id -> şirketler + ofis
+        self.orders = {}     # order_id -> (user_id, emanet para, hisse, emanet adet)
+        self.escrow_cash = {}    # user_id -> açık alış emirlerindeki para
+        self.escrow_shares = {}  # user_id -> {hisse: açık satış emirlerindeki adet}
+        self.ranking = Ranking()
+
+    def ensure(self, sources):
+        if self.sources and all(self.sources.get(path) is data for path, data in sources.items()):
+            return
+        self.sources = dict(sources)
+        bank, userstocks, market = sources[DATA_FILE], sources[USER_STOCK_FILE], sources[STOCK_FILE]
+        self.cash, self.holdings, self.assets = {}, {}, {}
+        self.orders, self.escrow_cash, self.escrow_shares = {}, {}, {}
+        self.prices = {name: info["stock_value"] for name, info in market.items()}
+        self.owners = {name: str(info["owner"]) for name, info in market.items() if info.get("owner")}
+        holder_index.ensure(userstocks)
+        for user_id, row in bank.items():
+            self.set_cash(user_id, row)
+        for order_id, order in sources[ORDER_FILE].items():
+            self.set_order(order_id, order)
+        for user_id in set(holder_index.positions) | set(self.escrow_shares):
+            self.set_holdings(user_id)
+        for user_id in set(sources[COMPANY_FILE]) | set(self.owners.values()):
+            self.set_assets(user_id)
+        users = set(self.cash) | set(self.holdings) | set(self.assets) | set(self.escrow_cash)
+        self.ranking.reset((user_id, self.score(user_id)) for user_id in users)
+
+    def set_cash(self, user_id, row):
+        if isinstance(row, dict):
+            self.cash[user_id] = row.get("bank_points", 0) - (row.get("loan_amount") or 0)
+        else:
+            self.cash.pop(user_id, None)
+
+    def set_order(self, order_id, order):
+        # Emrin eski emaneti düşülür, yenisi eklenir; etkilenen kullanıcıyı döndürür
+        old = self.orders.pop(order_id, None)
+        if old is not None:
+            user_id, cash, stock, shares = old
+            self.add_escrow(user_id, -cash, stock, -shares)
+        if order is not None:
+            shares = order["amount"] if order["side"] == "sell" else 0
+            self.orders[order_id] = (order["user"], order["escrow"], order["stock"], shares)
+            self.add_escrow(order["user"], order["escrow"], order["stock"], shares)
+        return order["user"] if order is not None else old[0] if old is not None else None
+
+    def add_escrow(self, user_id, cash, stock, shares):
+        if cash:
+            self.escrow_cash[user_id] = self.escrow_cash.get(user_id, 0) + cash
+            if not self.escrow_cash[user_id]:
+                del self.escrow_cash[user_id]
+        if shares:
+            positions = self.escrow_shares.setdefault(user_id, {})
+            positions[stock] = positions.get(stock, 0) + shares
+            if not positions[stock]:
+                del positions[stock]
+            if not positions:
+                del self.escrow_shares[user_id]
+
+    def set_holdings(self, user_id):
+        positions = list(holder_index.positions.get(user_id, {}).items())
+        positions += self.escrow_shares.get(user_id, {}).items()
+        if positions:
+            self.holdings[user_id] = sum(shares * self.prices.get(stock, 0) for stock, shares in positions)
+        else:
+            self.holdings.pop(user_id, None)
+
+    def set_assets(self, user_id):
+        company = self.sources[COMPANY_FILE].get(user_id)
+        value = office_value(company) if company is not None else 0
+        value += sum(self.prices.get(stock, 0) * COMPANY_PRICE_MULTIPLIER
+                     for stock, owner in self.owners.items() if owner == user_id)
+        if value:
+            self.assets[user_id] = value
+        else:
+            self.assets.pop(user_id, None)
+
+    def reprice(self, stock, info):
+        price = info["stock_value"] if info else 0
+        diff = price - self.prices.get(stock, 0)
+        self.prices[stock] = price
+        for user_id, shares in holder_index.holders.get(stock, {}).items():
+            self.holdings[user_id] += shares * diff
+            self.refresh(user_id)
+        if diff:
+            # Emanetteki hisseler; açık satış emri az olduğundan doğrudan taranır
+            for user_id, positions in self.escrow_shares.items():
+                if stock in positions:
+                    self.holdings[user_id] += positions[stock] * diff
+                    self.refresh(user_id)
+
+        old_owner = self.owners.pop(stock, None)
+        if info and info.get("owner"):
+            self.owners[stock] = str(info["owner"])
+        if diff or old_owner != self.owners.get(stock):
+            for user_id in {old_owner, self.owners.get(stock)} - {None}:
+                self.set_assets(user_id)
+                self.refresh(user_id)
+
+    def score(self, user_id):
+        if user_id not in self.cash and user_id not in self.holdings and user_id not in self.assets \
+                and user_id not in self.escrow_cash:
+            return None
+        cash, holdings, assets = self.breakdown(user_id)
+        return cash + holdings + assets
+
+    def refresh(self, user_id):
+        self.ranking.set(user_id, self.score(user_id))
+
+    def row_changed(self, path, data, key):
+        if self.sources.get(path) is not data:
+            return
+        if path == STOCK_FILE:
+            self.reprice(key, data.get(key))
+            return
+        if path == ORDER_FILE:
+            user_id = self.set_order(key, data.get(key))
+            if user_id is not None:
+                self.set_holdings(user_id)
+                self.refresh(user_id)
+            return
+        if path == DATA_FILE:
+            self.set_cash(key, data.get(key))
+        elif path == USER_STOCK_FILE:
+            self.set_holdings(key)
+        elif path == COMPANY_FILE:
+            self.set_assets(key)
+        self.refresh(key)
+
+    def store_replaced(self, path, data):
+        if self.sources.get(path) is not data:
+            return
+        if path == STOCK_FILE:
+            # Fiyat tick'i: sadece fiyatı değişen hisselerin sahipleri yeniden değerlenir
+            for stock, info in data.items():
+                if info["stock_value"] != self.prices.get(stock) or \
+                        (str(info["owner"]) if info.get("owner") else None) != self.owners.get(stock):
+                    self.reprice(stock, info)
+        elif path == COMPANY_FILE:
+            for user_id in set(data) | set(self.assets):
+                self.set_assets(user_id)
+                self.refresh(user_id)
+        else:
+            self.sources = {}
+
+    def breakdown(self, user_id):
+        cash = self.cash.get(user_id, 0) + self.escrow_cash.get(user_id, 0)
+        return cash, self.holdings.get(user_id, 0), self.assets.get(user_id, 0)
+
+
+net_worth = NetWorthIndex()
+
+@bot.command()
+async def networth(ctx):
+    net_worth.ensure({path: await read_json(path) for path in NET_WORTH_STORES})
+    if INCOME_MODE == "accrual":
+        await settle_leaders(net_worth.ranking, 20)
+
+    top_users = net_worth.ranking.top(20)
+    names = await name_resolver.names(top_users)
+
+    embed = discord.Embed(
+        title="🏦 Leaderboard - Net Worth",
+        description="Cash + stocks + companies, minus outstanding loans.",
+        color=0x2ecc71
+    )
+    for i, user_id in enumerate(top_users, start=1):
+        cash, holdings, assets = net_worth.breakdown(user_id)
+        username = names[user_id] or f"User {user_id}"
+        embed.add_field(
+            name=f"#{i} - {username}",
+            value=f"${cash + holdings + assets:,.0f}\n💵 ${cash:,.0f} · 📈 ${holdings:,.0f} · 🏢 ${assets:,.0f}",
+            inline=False
+        )
+
+    rank = net_worth.ranking.rank(str(ctx.author.id))
+    if rank is not None:
+        embed.set_footer(text=f"Your rank: #{rank:,} of {len(net_worth.ranking.scores):,}")
+    await ctx.send(embed=embed)
+
+
 async def post_stock_market(channel):
-    with open(STOCK_FILE, "r") as f:
-        market = json.load(f)
+    market = await read_json(STOCK_FILE, stock_lock)
 
     embed = discord.Embed(title="📈 Stock Market", color=0x00ff00)
     for name, data in market.items():
@@ -447,84 +1958,283 @@ async def post_stock_market(channel):
             diff_str = "No change"
             field_color = 0x999999  # gri
 
+        value = f"Current value: ${new}\nChange: {diff_str}"
+        if name in tick_engine.last_flow:
+            net, impact = tick_engine.last_flow[name]
+            value += f"\nOrder flow: {net:+,} shares ({impact * 100:+.2f}% impact)"
+        if holder_index.data is not None:
+            value += (f"\nShares outstanding: {holder_index.outstanding.get(name, 0):,}"
+                      f" · Market cap: ${holder_index.market_cap(name, new):,}")
+
         embed.add_field(
             name=f"{name} {sign}",
-            value=f"Current value: ${new}\nChange: {diff_str}",
+            value=value,
             inline=False
         )
 
     await channel.send(embed=embed)
 
-COMPANY_INCOME_CHANNEL_ID = 1399484671288414208  # Gelir raporu için kanal ID'nizi buraya koyun
+# Ekonomi tick'i: eskiden ayrı ayrı 2 dakikada bir çalışan döngüler tek geçişte ve
+# sabit sırayla çalışır: fiyatlar, şirket geliri, çalışan XP'si, hisse şirketi sahip
+# geliri, temettüler, kredi cezaları. Store'lar bir kez okunur; emir gerçekleşmeleri ve
+# tüm bakiye değişiklikleri tek işlemle yazılır. İşlemle geri alınamayan değişiklikler
+# (çalışan XP'si, sahip geliri endeksi) sadece işlem commit olduktan sonra uygulanır.
+# INCOME_MODE=accrual iken şirket geliri ve XP tick'te hiç işlenmez, sahip geliri sadece
+# hisse endeksine eklenir (bkz. settle_users).
+ECONOMY_TICK_MINUTES = float(os.getenv("ECONOMY_TICK_MINUTES", "2"))
+TICK_PHASES = ("prices", "company_income", "employee_xp", "owner_income", "dividends", "penalties")
+tick_timings = {phase: Histogram() for phase in TICK_PHASES}
+tick_state = {"ticks": 0, "errors": 0, "last_duration": 0.0}
+
+def log_tick_error(step, error):
+    # Bir aşamanın hatası diğerlerini ve sonraki tick'leri durdurmasın
+    tick_state["errors"] += 1
+    print(f"[tick] {step} failed: {error!r}")
+    traceback.print_exc()
+
+# Temettü: her DIVIDEND_INTERVAL saniyede hisse başına fiyatın DIVIDEND_YIELD katı ödenir.
+# Sahipler holder_index'ten gelir, kullanıcı başına tek bakiye değişikliği yazılır. Son ödeme
+# zamanı tick durum store'unda tutulur; bot yeniden başlasa da sayaç sıfırlanmaz.
+DIVIDEND_YIELD = float(os.getenv("DIVIDEND_YIELD", "0.001"))
+DIVIDEND_INTERVAL = float(os.getenv("DIVIDEND_INTERVAL", "3600"))
+TICK_STATE_FILE = "MAINTickState.json"
+
+def dividends_due(tx, now):
+    # İlk tick sayacı başlatır; ödeme zamanı tick işlemiyle birlikte yazılır
+    tick_meta = tx[TICK_STATE_FILE]
+    last_paid = tick_meta.get("dividends", {}).get("last_paid")
+    if last_paid is not None and now - last_paid < DIVIDEND_INTERVAL:
+        return False
+    tx.touch(TICK_STATE_FILE, "dividends")
+    tick_meta["dividends"] = {"last_paid": now}
+    return last_paid is not None
+
+def pay_dividends(bank, market):
+    payouts = {}
+    for stock, info in market.items():
+        per_share = info["stock_value"] * DIVIDEND_YIELD
+        for user_id, shares in holder_index.holders.get(stock, {}).items():
+            payouts[user_id] = payouts.get(user_id, 0) + shares * per_share
+
+    total = 0
+    for user_id, amount in payouts.items():
+        amount = int(amount)
+        if amount > 0:
+            ensure_account(bank, user_id)
+            adjust_balance(bank, user_id, amount, "dividend")
+            total += amount
+    return total, len(payouts)
+
+async def run_economy_tick():
+    now = time.time()
+    tick_started = time.perf_counter()
+    market = await read_json(STOCK_FILE, stock_lock)
+    companies = await read_json(COMPANY_FILE, company_lock)
+    timings = {}
 
-async def post_company_income_report(channel):
-    reports = await process_company_income()
-    if not reports:
+    started = time.perf_counter()
+    try:
+        tick_engine.tick(market)
+        price_history.record(tick_engine.names, tick_engine.prices, now)
+    except Exception as e:
+        log_tick_error("prices", e)
+    timings["prices"] = time.perf_counter() - started
+
+    accrual = INCOME_MODE == "accrual"
+    companies_changed = False
+    drain = []
+    if accrual:
+        companies_changed = start_accrual(companies, now)
+    elif not accrual_state["drained"]:
+        # accrual modundan dönülüyorsa biriken gelir bu tick'in işleminde bir kez ödenir
+        drain = due_users(companies, market, None, now)
+
+    holder_index.ensure(await read_json(USER_STOCK_FILE, user_stock_lock))
+    filled = 0
+    dividends = None
+    company_reports = []
+    owner_summary = []
+    try:
+        async with transaction(DATA_FILE, USER_STOCK_FILE, ORDER_FILE, COMPANY_FILE, STOCK_FILE,
+                               TICK_STATE_FILE, reason="economy_tick") as tx:
+            bank = tx[DATA_FILE]
+
+            started = time.perf_counter()
+            filled = match_orders(tx, market)
+            timings["prices"] += time.perf_counter() - started
+
+            for user_id in drain:
+                settle_income(tx, user_id, now)
+
+            if not accrual:
+                started = time.perf_counter()
+                company_reports = pay_company_income(bank, companies)
+                timings["company_income"] = time.perf_counter() - started
+
+                started = time.perf_counter()
+                owner_summary = pay_stock_owner_income(bank, market)
+                timings["owner_income"] = time.perf_counter() - started
+
+            if DIVIDEND_YIELD > 0 and dividends_due(tx, now):
+                started = time.perf_counter()
+                dividends = pay_dividends(bank, market)
+                timings["dividends"] = time.perf_counter() - started
+
+            started = time.perf_counter()
+            apply_loan_penalties(bank, now)
+            timings["penalties"] = time.perf_counter() - started
+    except Exception as e:
+        # Banka işlemi geri alındı: bu tick'in gelirleri ödenmez, duyurulmaz. Emirler yığına döner,
+        # kredi takvimi yeniden kurulur, temettü zamanı geri alınır; bunlar sonraki tick'te işlenir.
+        filled, dividends = 0, None
+        company_reports, owner_summary = [], []
+        log_tick_error("income", e)
+    else:
+        if not accrual:
+            accrual_state["drained"] = True
+
+        if accrual:
+            started = time.perf_counter()
+            owner_summary = accrue_owner_income(market)
+            timings["owner_income"] = time.perf_counter() - started
+        else:
+            # XP bu tick'in geliri ödendikten sonra, aynı sırayla işlenir
+            started = time.perf_counter()
+            train_employees(companies)
+            timings["employee_xp"] = time.perf_counter() - started
+            companies_changed = True
+
+    await write_json(STOCK_FILE, market, stock_lock)
+    if companies_changed:
+        await write_json(COMPANY_FILE, companies, company_lock)
+    if price_history.unsaved >= HISTORY_SAVE_EVERY:
+        await price_history.save()
+
+    for phase, seconds in timings.items():
+        tick_timings[phase].observe(seconds)
+    tick_state["ticks"] += 1
+    tick_state["last_duration"] = time.perf_counter() - tick_started
+    if filled:
+        print(f"[orders] filled {filled} orders")
+    if dividends and dividends[0]:
+        print(f"[dividends] paid ${dividends[0]:,} to {dividends[1]:,} holders")
+    return company_reports, owner_summary
+
+@tasks.loop(minutes=ECONOMY_TICK_MINUTES)
+async def economy_tick_loop():
+    try:
+        company_reports, owner_summary = await run_economy_tick()
+    except Exception as e:
+        log_tick_error("tick", e)
         return
-    embed = discord.Embed(
-        title="🏢 Company Income Report",
-        description="Updated every 2 minutes",
-        color=0x3498db
-    )
-    for rep in reports:
-        embed.add_field(
-            name=f"{rep['company_name']} ({rep['user_id']})",
-            value=f"💵 Income: ${rep['income']}",
-            inline=False
-        )
-    await channel.send(embed=embed)
 
-@tasks.loop(minutes=2)
-async def company_income_report_loop():
-    channel = bot.get_channel(COMPANY_INCOME_CHANNEL_ID)
-    if channel:
-        await post_company_income_report(channel)
+    # Duyuru hataları bir sonraki tick'i etkilemesin
+    try:
+        channel = bot.get_channel(STOCK_MARKET_CHANNEL_ID)
+        if channel:
+            await post_stock_market(channel)
+        channel = bot.get_channel(INCOME_REPORT_CHANNEL_ID)
+        if channel:
+            await post_income_report(channel, company_reports)
+            await post_owner_income_report(channel, owner_summary)
+    except Exception as e:
+        log_tick_error("reports", e)
 
-@tasks.loop(minutes=2)
-async def stock_market_loop():
-    await update_stock_values()
-    channel = bot.get_channel(STOCK_MARKET_CHANNEL_ID)
-    if channel:
-        await post_stock_market(channel)
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
 
-async def process_company_income():
-    companies = await read_json(COMPANY_FILE, company_lock)
-    bank = await read_json(DATA_FILE, data_lock)
+def sparkline(values):
+    low, high = min(values), max(values)
+    span = (high - low) or 1
+    return "".join(SPARK_CHARS[int((value - low) / span * (len(SPARK_CHARS) - 1))] for value in values)
+
+@bot.command()
+async def chart(ctx, stock_name: str, interval: str = "1h"):
+    if interval not in CANDLE_INTERVALS:
+        return await ctx.send("❌ Interval must be `1h` or `1d`.")
+
+    name = price_history.lookup(stock_name)
+    if name is None:
+        return await ctx.send("❌ No price history for that stock.")
+
+    candles = price_history.candles(name, CANDLE_INTERVALS[interval])[-24:]
+    if not candles:
+        return await ctx.send("❌ No price history for that stock.")
+
+    first, last = candles[0], candles[-1]
+    change = last["close"] - first["open"]
+    change_percent = change / first["open"] * 100 if first["open"] else 0
+    embed = discord.Embed(
+        title=f"📈 {name} · {interval} candles",
+        description=f"```\n{sparkline([candle['close'] for candle in candles])}\n```",
+        color=0x00ff00 if change >= 0 else 0xff0000
+    )
 
+    rows = [f"{'time (UTC)':<12} {'open':>8} {'high':>8} {'low':>8} {'close':>8}"]
+    for candle in candles[-8:]:
+        label = time.strftime("%m-%d %H:%M", time.gmtime(candle["time"]))
+        rows.append(f"{label:<12} {candle['open']:>8,} {candle['high']:>8,} {candle['low']:>8,} {candle['close']:>8,}")
+    embed.add_field(name="Recent candles", value="```\n" + "\n".join(rows) + "\n```", inline=False)
+    embed.set_footer(text=f"{len(candles)} candles · change {change:+,} ({change_percent:+.2f}%)")
+    await ctx.send(embed=embed)
+
+def pay_company_income(bank, companies):
     company_reports = []
 
     for user_id, company in companies.items():
         total_income = 0
-        for emp in company["employees"]:
-            level = emp["level"]
-            if level < 10:
-                emp["xp"] += 15
-                if emp["xp"] >= 100:
-                    emp["xp"] = 0
-                    emp["level"] += 1
-                    if emp["level"] > 10:
-                        emp["level"] = 10
-
-            income = int(250 * (1.5 * (emp["level"] - 1)))
-            total_income += income
+        for cohort in company["employees"]:
+            total_income += employee_income(cohort["level"]) * cohort["count"]
 
         if user_id in bank:
-            bank[user_id]["bank_points"] += total_income
+            adjust_balance(bank, user_id, total_income, "company_income")
 
         company_reports.append({
             "user_id": user_id,
             "company_name": company["company_name"],
             "income": total_income,
-            "employee_count": len(company["employees"])
+            "employee_count": employee_count(company)
         })
 
-    await write_json(DATA_FILE, bank, data_lock)
-    await write_json(COMPANY_FILE, companies, company_lock)
-
     return company_reports
 
-async def post_income_report(channel):
-    reports = await process_company_income()
+def employee_income(level):
+    return int(250 * (1.5 * (level - 1)))
+
+def progress_cohort(cohort, ticks):
+    # train_employees + pay_company_income'ın `ticks` kez tekrarı, seviye başına bir adım:
+    # her tick önce mevcut seviyeden gelir, sonra 15 XP; 100 XP'de seviye atlanır
+    level, xp = cohort["level"], cohort["xp"]
+    income = 0
+    while ticks > 0:
+        if level >= 10:
+            income += employee_income(level) * ticks
+            break
+        to_next = -(-(100 - xp) // 15)
+        step = min(ticks, to_next)
+        income += employee_income(level) * step
+        ticks -= step
+        if step == to_next:
+            level, xp = level + 1, 0
+        else:
+            xp += 15 * step
+    cohort["level"], cohort["xp"] = level, xp
+    return income * cohort["count"]
+
+def train_employees(companies):
+    for company in companies.values():
+        leveled = False
+        for cohort in company["employees"]:
+            if cohort["level"] < 10:
+                cohort["xp"] += 15
+                if cohort["xp"] >= 100:
+                    cohort["xp"] = 0
+                    cohort["level"] = min(cohort["level"] + 1, 10)
+                    leveled = True
+        # Seviye atlayan kohort aynı seviyedeki başka bir kohortla çakışabilir
+        if leveled:
+            company["employees"] = merge_cohorts(company["employees"])
+
+async def post_income_report(channel, reports):
     if not reports:
         return
     embed = discord.Embed(
@@ -532,9 +2242,12 @@ async def post_income_report(channel):
         description="Updated every 2 minutes",
         color=0x3498db
     )
+    # Embed en fazla 25 alan alır
+    reports = sorted(reports, key=lambda rep: rep["income"], reverse=True)[:25]
+    names = await name_resolver.names([rep["user_id"] for rep in reports], channel.guild)
     for rep in reports:
         embed.add_field(
-            name=f"{rep['company_name']} ({rep['user_id']})",
+            name=f"{rep['company_name']} ({names[rep['user_id']] or rep['user_id']})",
             value=f"💵 Income: ${rep['income']}\n👨‍💼 Employees: {rep['employee_count']}",
             inline=False
         )
@@ -546,53 +2259,214 @@ async def sell_stock(user_id, stock_name, amount: int):
 
     user_id_str = str(user_id)
 
-    userstocks = await read_json(USER_STOCK_FILE, user_stock_lock)
-    bank = await read_json(DATA_FILE, data_lock)
-    market = await read_json(STOCK_FILE, stock_lock)
-
-    if user_id_str not in userstocks or stock_name not in userstocks[user_id_str]:
-        return False, f"You don't own any shares of {stock_name}."
-
-    owned_amount = userstocks[user_id_str][stock_name]
+    async with user_locks.hold(user_id), transaction(DATA_FILE, USER_STOCK_FILE, reason="sell_stock") as tx:
+        userstocks = tx[USER_STOCK_FILE]
+        bank = tx[DATA_FILE]
+        market = await read_json(STOCK_FILE, stock_lock)
 
-    if amount > owned_amount:
-        return False, f"You only own {owned_amount} shares of {stock_name}."
+        if user_id_str not in userstocks or stock_name not in userstocks[user_id_str]:
+            return False, f"You don't own any shares of {stock_name}."
 
-    if stock_name not in market:
-        return False, "That stock doesn't exist."
+        owned_amount = userstocks[user_id_str][stock_name]
 
-    stock_price = market[stock_name]["stock_value"]  # hisse fiyatı
-    earnings = stock_price * amount  # satıştan elde edilecek para
+        if amount > owned_amount:
+            return False, f"You only own {owned_amount} shares of {stock_name}."
 
-    # Hisseden düş
-    userstocks[user_id_str][stock_name] -= amount
-
-    # Eğer hisse miktarı sıfır ise kaydı temizle
-    if userstocks[user_id_str][stock_name] == 0:
-        del userstocks[user_id_str][stock_name]
-
-    # Para ekle
-    bank[user_id_str]["bank_points"] += earnings
-
-    await write_json(USER_STOCK_FILE, userstocks, user_stock_lock)
-    await write_json(DATA_FILE, bank, data_lock)
-
-    return True, f"You sold {amount} shares of {stock_name} for ${earnings}."
-
-@bot.command()
-async def portfolio(ctx):
-    user_id = str(ctx.author.id)
-    userstocks = await read_json(USER_STOCK_FILE, user_stock_lock)
-    market = await read_json(STOCK_FILE, stock_lock)
+        if stock_name not in market:
+            return False, "That stock doesn't exist."
+
+        stock_price = market[stock_name]["stock_value"]  # hisse fiyatı
+        earnings = stock_price * amount  # satıştan elde edilecek para
+
+        # Hisseden düş
+        tx.touch(USER_STOCK_FILE, user_id_str)
+        userstocks[user_id_str][stock_name] -= amount
+
+        # Eğer hisse miktarı sıfır ise kaydı temizle
+        if userstocks[user_id_str][stock_name] == 0:
+            del userstocks[user_id_str][stock_name]
+
+        # Para ekle
+        adjust_balance(bank, user_id_str, earnings, "sell_stock")
+        tick_engine.add_flow(stock_name, -amount)
+
+        return True, f"You sold {amount} shares of {stock_name} for ${earnings}."
+
+# Emir defteri: limit ve stop emirleri hisse başına yığınlarda (heap) fiyat-zaman
+# önceliğiyle bekler ve her piyasa tick'inde tek geçişte eşleştirilir.
+#   limit alış: fiyat <= limit olunca    limit satış: fiyat >= limit olunca
+#   stop alış:  fiyat >= stop olunca     stop satış:  fiyat <= stop olunca
+# Stop alış emanetin yetmediği bir fiyattan tetiklenirse alınabilen kadarı alınır, kalanı
+# stop fiyatından limit alış olarak beklemeye devam eder ("filled" gerçekleşen adedi tutar).
+# Emir verilirken alışta para, satışta hisse emanete alınır; bir tick'teki tüm
+# gerçekleşmeler tek bir işlemle (tek günlük satırı) yazılır.
+order_lock = get_store(ORDER_FILE).lock
+
+# Yığın anahtarı = işaret * fiyat; en üstteki emir anahtar <= işaret * güncel fiyat ise tetiklenir
+ORDER_SIGNS = {("buy", "limit"): -1, ("sell", "limit"): 1, ("buy", "stop"): 1, ("sell", "stop"): -1}
+
+class OrderBooks:
+    def __init__(self):
+        self.books = {}   # hisse -> {(side, type): [(anahtar, seq, order_id), ...]}
+        self.next_id = 1
+        self.loaded = False
+
+    def ensure_loaded(self, orders):
+        # Açılışta yığınlar store'daki açık emirlerden yeniden kurulur
+        if self.loaded:
+            return
+        self.loaded = True
+        for order in orders.values():
+            self.push(order)
+        self.next_id = max((int(order_id) for order_id in orders), default=0) + 1
+
+    def push(self, order):
+        kind = (order["side"], order["type"])
+        heap = self.books.setdefault(order["stock"], {}).setdefault(kind, [])
+        heapq.heappush(heap, (ORDER_SIGNS[kind] * order["price"], int(order["id"]), order["id"]))
+
+    @staticmethod
+    def valid(order_id, kind, orders):
+        # Emir silinmiş ya da türü değişmişse (kısmi stop alış -> limit) kayıt bayattır
+        order = orders.get(order_id)
+        return order is not None and (order["side"], order["type"]) == kind
+
+    def pop_triggered(self, market, orders):
+        # İptal edilmiş emirler yığında kalır, çıkarken atlanır
+        triggered = []
+        for stock, heaps in self.books.items():
+            if stock not in market:
+                continue
+            price = market[stock]["stock_value"]
+            for kind, heap in heaps.items():
+                limit = ORDER_SIGNS[kind] * price
+                while heap and (not self.valid(heap[0][2], kind, orders) or heap[0][0] <= limit):
+                    _, _, order_id = heapq.heappop(heap)
+                    if self.valid(order_id, kind, orders):
+                        triggered.append((order_id, price))
+        return triggered
+
+    def restore(self, orders, triggered):
+        # İşlem geri alındı: çıkarılan emirler geri alınan satırlarıyla yığına döner
+        for order_id, _ in triggered:
+            if order_id in orders:
+                self.push(orders[order_id])
+
+
+order_books = OrderBooks()
+
+def fill_order(tx, order, price):
+    bank, userstocks, orders = tx[DATA_FILE], tx[USER_STOCK_FILE], tx[ORDER_FILE]
+    user_id, stock = order["user"], order["stock"]
+    tx.touch(ORDER_FILE, order["id"])
+    tx.touch(USER_STOCK_FILE, user_id)
+    del orders[order["id"]]
+    # Hesabı silinmiş kullanıcının kalmış emri tick'i düşürmesin
+    ensure_account(bank, user_id)
+
+    if order["side"] == "buy":
+        # Stop alışta fiyat emanetten yüksek olabilir, emanetin yettiği kadar alınır
+        shares = min(order["amount"], order["escrow"] // price)
+        if shares:
+            holdings = userstocks.setdefault(user_id, {})
+            holdings[stock] = holdings.get(stock, 0) + shares
+        refund = order["escrow"] - shares * price
+        rest = min(order["amount"] - shares, refund // order["price"]) if order["type"] == "stop" else 0
+        if rest:
+            remainder = orders[order["id"]] = {**order, "type": "limit", "amount": rest, "escrow": rest * order["price"],
+                                               "filled": order.get("filled", 0) + shares}
+            order_books.push(remainder)
+            refund -= remainder["escrow"]
+        if refund:
+            adjust_balance(bank, user_id, refund, "order_refund")
+        flow = shares
+    else:
+        adjust_balance(bank, user_id, order["amount"] * price, "order_fill")
+        flow = -order["amount"]
+    tick_engine.add_flow(stock, flow)
+    tx.on_rollback(tick_engine.add_flow, stock, -flow)
+    return abs(flow)
+
+def match_orders(tx, market):
+    # Tick işleminin içinde çalışır. Gerçekleşmeler yalnızca bakiye ve hisse ekler (emanet emir
+    # verilirken alındı), bu yüzden gelir ödemeleri gibi kullanıcı kilidi beklemeden yapılır.
+    orders = tx[ORDER_FILE]
+    order_books.ensure_loaded(orders)
+    triggered = order_books.pop_triggered(market, orders)
+    tx.on_rollback(order_books.restore, orders, triggered)
+    for order_id, price in triggered:
+        fill_order(tx, orders[order_id], price)
+    return len(triggered)
+
+async def place_order(user_id, stock_name, side, order_type, amount, price):
+    if order_type not in ("limit", "stop"):
+        return False, "Order type must be `market`, `limit` or `stop`."
+    if amount <= 0 or price is None or price <= 0:
+        return False, "Please enter a valid amount and price for the order."
 
-    if user_id not in userstocks or len(userstocks[user_id]) == 0:
-        return await ctx.send("📭 Your portfolio is empty.")
+    user_id = str(user_id)
+    async with user_locks.hold(user_id):
+        await init_user(user_id)
+        market = await read_json(STOCK_FILE, stock_lock)
+        if stock_name not in market:
+            return False, "That stock doesn't exist."
+
+        async with transaction(DATA_FILE, USER_STOCK_FILE, ORDER_FILE, reason="place_order") as tx:
+            bank, userstocks, orders = tx[DATA_FILE], tx[USER_STOCK_FILE], tx[ORDER_FILE]
+            order_books.ensure_loaded(orders)
+
+            escrow = 0
+            if side == "buy":
+                escrow = price * amount
+                if bank[user_id]["bank_points"] < escrow:
+                    return False, f"You can't afford to reserve ${escrow} for this order."
+                adjust_balance(bank, user_id, -escrow, "order_escrow")
+            else:
+                owned = userstocks.get(user_id, {}).get(stock_name, 0)
+                if owned < amount:
+                    return False, f"You only own {owned} shares of {stock_name}."
+                tx.touch(USER_STOCK_FILE, user_id)
+                userstocks[user_id][stock_name] -= amount
+                if userstocks[user_id][stock_name] == 0:
+                    del userstocks[user_id][stock_name]
+
+            order_id = str(order_books.next_id)
+            order_books.next_id += 1
+            tx.touch(ORDER_FILE, order_id)
+            order = orders[order_id] = {
+                "id": order_id, "user": user_id, "stock": stock_name, "side": side, "type": order_type,
+                "price": price, "amount": amount, "escrow": escrow, "created": time.time()
+            }
+        order_books.push(order)
+
+    return True, f"Order #{order_id} placed: {order_type} {side} {amount} shares of {stock_name} at ${price}."
+
+async def cancel_order(user_id, order_id):
+    user_id = str(user_id)
+    async with user_locks.hold(user_id), transaction(DATA_FILE, USER_STOCK_FILE, ORDER_FILE, reason="cancel_order") as tx:
+        bank, userstocks, orders = tx[DATA_FILE], tx[USER_STOCK_FILE], tx[ORDER_FILE]
+        order = orders.get(order_id)
+        if order is None or order["user"] != user_id:
+            return False, "You have no open order with that id."
+
+        # Emanet iade edilir, yığındaki kayıt eşleştirmede atlanır
+        tx.touch(ORDER_FILE, order_id)
+        del orders[order_id]
+        if order["side"] == "buy":
+            adjust_balance(bank, user_id, order["escrow"], "order_refund")
+        else:
+            tx.touch(USER_STOCK_FILE, user_id)
+            holdings = userstocks.setdefault(user_id, {})
+            holdings[order["stock"]] = holdings.get(order["stock"], 0) + order["amount"]
 
-    embed = discord.Embed(title=f"📊 {ctx.author.display_name}'s Portfolio", color=0x3498db)
+    return True, f"Order #{order_id} cancelled."
 
+def value_portfolio(holdings, market):
+    # Embed alanları (ad, değer) ve toplam değer
+    fields = []
     total_value = 0
 
-    for stock_name, amount in userstocks[user_id].items():
+    for stock_name, amount in holdings.items():
         if stock_name not in market:
             continue
 
@@ -615,26 +2489,89 @@ async def portfolio(ctx):
             emoji = "⏸️"
             change_str = "No change"
 
-        embed.add_field(
-            name=f"{stock_name} {emoji} — {amount} shares",
-            value=f"Price: ${current_price}\nChange: {change_str}\nTotal value: ${stock_value}",
-            inline=False
-        )
+        fields.append((f"{stock_name} {emoji} — {amount} shares",
+                       f"Price: ${current_price}\nChange: {change_str}\nTotal value: ${stock_value}"))
+
+    return fields, total_value
+
+# Portföy değerlemeleri: fiyatlar sadece tick'te değişir, bu yüzden kullanıcı başına
+# değerleme fiyat dönemiyle (tick_engine.epoch) birlikte saklanır. Yeni dönemde önbellek
+# boşalır; kullanıcının kendi alım/satımı (row_changed) sadece onun kaydını siler.
+class PortfolioCache:
+    def __init__(self):
+        self.epoch = None
+        self.entries = {}  # user_id -> (alanlar, toplam değer)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, userstocks, market):
+        if self.epoch != tick_engine.epoch:
+            self.epoch = tick_engine.epoch
+            self.entries.clear()
+        entry = self.entries.get(user_id)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        entry = self.entries[user_id] = value_portfolio(userstocks.get(user_id, {}), market)
+        return entry
+
+    def invalidate(self, user_id=None):
+        if user_id is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(user_id, None)
+
+
+portfolio_cache = PortfolioCache()
 
+@bot.command()
+async def portfolio(ctx):
+    user_id = str(ctx.author.id)
+    userstocks = await read_json(USER_STOCK_FILE, user_stock_lock)
+    market = await read_json(STOCK_FILE, stock_lock)
+
+    if user_id not in userstocks or len(userstocks[user_id]) == 0:
+        return await ctx.send("📭 Your portfolio is empty.")
+
+    fields, total_value = portfolio_cache.get(user_id, userstocks, market)
+
+    embed = discord.Embed(title=f"📊 {ctx.author.display_name}'s Portfolio", color=0x3498db)
+    for name, value in fields:
+        embed.add_field(name=name, value=value, inline=False)
     embed.set_footer(text=f"Total portfolio value: ${total_value}")
 
     await ctx.send(embed=embed)
 
 
-@tasks.loop(minutes=2)
-async def income_report_loop():
-    channel = bot.get_channel(1399484671288414208)
-    if channel:
-        await post_income_report(channel)
+@bot.command()
+async def sellstock(ctx, stock_name: str, amount: int, order_type: str = "market", price: int = None):
+    if order_type.lower() == "market":
+        success, msg = await sell_stock(ctx.author.id, stock_name, amount)
+    else:
+        success, msg = await place_order(ctx.author.id, stock_name, "sell", order_type.lower(), amount, price)
+    await ctx.send(msg)
+
+@bot.command()
+async def orders(ctx):
+    user_id = str(ctx.author.id)
+    open_orders = [order for order in (await read_json(ORDER_FILE, order_lock)).values() if order["user"] == user_id]
+    if not open_orders:
+        return await ctx.send("📭 You have no open orders.")
+
+    embed = discord.Embed(title=f"📋 {ctx.author.display_name}'s Open Orders", color=0x3498db)
+    for order in sorted(open_orders, key=lambda order: int(order["id"]))[:25]:
+        embed.add_field(
+            name=f"#{order['id']} · {order['type']} {order['side']} {order['stock']}",
+            value=f"{order['amount']} shares at ${order['price']:,}"
+                  + (f" ({order['filled']} already filled)" if order.get("filled") else ""),
+            inline=False
+        )
+    await ctx.send(embed=embed)
 
 @bot.command()
-async def sellstock(ctx, stock_name: str, amount: int):
-    success, msg = await sell_stock(ctx.author.id, stock_name, amount)
+async def cancelorder(ctx, order_id: str):
+    success, msg = await cancel_order(ctx.author.id, order_id.lstrip("#"))
     await ctx.send(msg)
 
 @bot.command()
@@ -680,7 +2617,7 @@ async def office(ctx):
     max_employees = max_employees_list[min(office_level - 1, len(max_employees_list) - 1)]
 
     # Ofisteki doluluk oranı
-    current_count = len(employees)
+    current_count = employee_count(company)
 
     # Bir sonraki ofis seviyesi ve fiyatı
     next_level = office_level + 1
@@ -691,16 +2628,16 @@ async def office(ctx):
 
     # Çalışan seviyelerinin sayısı
     level_counts = {}
-    for emp in employees:
-        lvl = emp.get("level", 1)
-        level_counts[lvl] = level_counts.get(lvl, 0) + 1
+    for cohort in employees:
+        lvl = cohort.get("level", 1)
+        level_counts[lvl] = level_counts.get(lvl, 0) + cohort["count"]
 
     # Şirket geliri (toplam çalışan gelirleri)
     total_income = 0
-    for emp in employees:
-        level = emp.get("level", 1)
+    for cohort in employees:
+        level = cohort.get("level", 1)
         income = int(250 * (1.5 ** (level - 1)))
-        total_income += income
+        total_income += income * cohort["count"]
 
     embed = discord.Embed(title=f"🏢 Company Office: {company['company_name']}", color=0x3498db)
 
@@ -748,8 +2685,11 @@ async def hire(ctx, amount: int = 1):
     await ctx.send(summary)
 
 @bot.command()
-async def buystock(ctx, stock_name: str, amount: int):
-    success, msg = await buy_stock(ctx.author.id, stock_name, amount)
+async def buystock(ctx, stock_name: str, amount: int, order_type: str = "market", price: int = None):
+    if order_type.lower() == "market":
+        success, msg = await buy_stock(ctx.author.id, stock_name, amount)
+    else:
+        success, msg = await place_order(ctx.author.id, stock_name, "buy", order_type.lower(), amount, price)
     await ctx.send(msg)
 
 @bot.command()
@@ -779,73 +2719,75 @@ from discord.ext.commands import cooldown, BucketType
 
 @bot.command()
 async def slot(ctx, amount: int):
-    await init_user(ctx.author.id)
-    data = await read_json(DATA_FILE, data_lock)
-    user_id = str(ctx.author.id)
-
-    if amount < 50:
-        return await ctx.send("🪙 Minimum bet is $50.")
-    if data[user_id]["bank_points"] < amount:
-        return await ctx.send("💸 You don't have enough money to bet that much.")
-
-    data[user_id]["bank_points"] -= amount
-
-    symbols = ["🍒", "🍋", "🍇", "🔔", "💎", "🔴", "💲", "♠️", "7️⃣"]
-    result = [random.choice(symbols) for _ in range(3)]
-    await ctx.send(f"🎰 {' | '.join(result)}")
-
-    if len(set(result)) == 1:
-        win = amount * 5
-        data[user_id]["bank_points"] += win
-        await ctx.send(f"🎉 Jackpot! You won ${win}!")
-    elif len(set(result)) == 2:
-        win = int(amount * 2.5)
-        data[user_id]["bank_points"] += win
-        await ctx.send(f"👍 You matched two symbols and won ${win}.")
-    else:
-        await ctx.send("😢 No match. Better luck next time!")
+    async with user_locks.hold(ctx.author.id):
+        await init_user(ctx.author.id)
+        data = await read_json(DATA_FILE, data_lock)
+        user_id = str(ctx.author.id)
+
+        if amount < 50:
+            return await ctx.send("🪙 Minimum bet is $50.")
+        if data[user_id]["bank_points"] < amount:
+            return await ctx.send("💸 You don't have enough money to bet that much.")
+
+        adjust_balance(data, user_id, -amount, "slot")
+
+        symbols = ["🍒", "🍋", "🍇", "🔔", "💎", "🔴", "💲", "♠️", "7️⃣"]
+        result = [random.choice(symbols) for _ in range(3)]
+        await ctx.send(f"🎰 {' | '.join(result)}")
+
+        if len(set(result)) == 1:
+            win = amount * 5
+            adjust_balance(data, user_id, win, "slot")
+            await ctx.send(f"🎉 Jackpot! You won ${win}!")
+        elif len(set(result)) == 2:
+            win = int(amount * 2.5)
+            adjust_balance(data, user_id, win, "slot")
+            await ctx.send(f"👍 You matched two symbols and won ${win}.")
+        else:
+            await ctx.send("😢 No match. Better luck next time!")
 
-    await write_json(DATA_FILE, data, data_lock)
+        await write_json(DATA_FILE, data, data_lock, keys=[user_id])
 
 active_blackjacks = {}
 
 @bot.command()
 async def blackjack(ctx, amount: int):
-    await init_user(ctx.author.id)
-    user_id = str(ctx.author.id)
-    data = await read_json(DATA_FILE, data_lock)
+    async with user_locks.hold(ctx.author.id):
+        await init_user(ctx.author.id)
+        user_id = str(ctx.author.id)
+        data = await read_json(DATA_FILE, data_lock)
 
-    if user_id in active_blackjacks:
-        return await ctx.send("⏳ You already have an ongoing blackjack game.")
+        if user_id in active_blackjacks:
+            return await ctx.send("⏳ You already have an ongoing blackjack game.")
 
-    if amount < 100:
-        return await ctx.send("🪙 Minimum bet is $100.")
+        if amount < 100:
+            return await ctx.send("🪙 Minimum bet is $100.")
 
-    if data[user_id]["bank_points"] < amount:
-        return await ctx.send("💸 You don't have enough money to bet that much.")
+        if data[user_id]["bank_points"] < amount:
+            return await ctx.send("💸 You don't have enough money to bet that much.")
 
-    # Para düşüldü
-    data[user_id]["bank_points"] -= amount
-    await write_json(DATA_FILE, data, data_lock)
+        # Para düşüldü
+        adjust_balance(data, user_id, -amount, "blackjack")
+        await write_json(DATA_FILE, data, data_lock, keys=[user_id])
 
-    def draw():
-        return random.randint(2, 11)  # As simplification
+        def draw():
+            return random.randint(2, 11)  # As simplification
 
-    player_hand = [draw(), draw()]
-    dealer_hand = [draw(), draw()]
+        player_hand = [draw(), draw()]
+        dealer_hand = [draw(), draw()]
 
-    active_blackjacks[user_id] = {
-        "bet": amount,
-        "player": player_hand,
-        "dealer": dealer_hand,
-        "doubled": False,
-        "channel": ctx.channel
-    }
+        active_blackjacks[user_id] = {
+            "bet": amount,
+            "player": player_hand,
+            "dealer": dealer_hand,
+            "doubled": False,
+            "channel": ctx.channel
+        }
 
-    await ctx.send(
-        f"🃏 You drew {player_hand} (Total: {sum(player_hand)}). Dealer shows [{dealer_hand[0]}, ❓].\n"
-        "Type `hit`, `stand`, or `double`."
-    )
+        await ctx.send(
+            f"🃏 You drew {player_hand} (Total: {sum(player_hand)}). Dealer shows [{dealer_hand[0]}, ❓].\n"
+            "Type `hit`, `stand`, or `double`."
+        )
 
 
 async def finish_blackjack(user_id):
@@ -864,26 +2806,27 @@ async def finish_blackjack(user_id):
     player_total = total(player)
     dealer_total = total(dealer)
 
-    data = await read_json(DATA_FILE, data_lock)
-
-    if player_total > 21:
-        result = f"💥 You busted with {player_total}. You lost ${bet}."
-    elif dealer_total > 21 or player_total > dealer_total:
-        data[user_id]["bank_points"] += bet * 2
-        await write_json(DATA_FILE, data, data_lock)
-        result = f"🎉 You win! Dealer had {dealer_total}. You earned ${bet * 2}."
-    elif player_total == dealer_total:
-        data[user_id]["bank_points"] += bet
-        await write_json(DATA_FILE, data, data_lock)
-        result = f"🤝 It's a tie. Both had {player_total}. Your ${bet} is returned."
-    else:
-        result = f"😢 Dealer wins with {dealer_total}. You lost ${bet}."
+    async with user_locks.hold(user_id):
+        data = await read_json(DATA_FILE, data_lock)
+
+        if player_total > 21:
+            result = f"💥 You busted with {player_total}. You lost ${bet}."
+        elif dealer_total > 21 or player_total > dealer_total:
+            adjust_balance(data, user_id, bet * 2, "blackjack")
+            await write_json(DATA_FILE, data, data_lock, keys=[user_id])
+            result = f"🎉 You win! Dealer had {dealer_total}. You earned ${bet * 2}."
+        elif player_total == dealer_total:
+            adjust_balance(data, user_id, bet, "blackjack")
+            await write_json(DATA_FILE, data, data_lock, keys=[user_id])
+            result = f"🤝 It's a tie. Both had {player_total}. Your ${bet} is returned."
+        else:
+            result = f"😢 Dealer wins with {dealer_total}. You lost ${bet}."
 
-    await channel.send(
-        f"🧑 Your hand: {player} (Total: {player_total})\n"
-        f"🤖 Dealer hand: {dealer} (Total: {dealer_total})\n"
-        f"{result}"
-    )
+        await channel.send(
+            f"🧑 Your hand: {player} (Total: {player_total})\n"
+            f"🤖 Dealer hand: {dealer} (Total: {dealer_total})\n"
+            f"{result}"
+        )
 
 
 @bot.command()
@@ -893,21 +2836,22 @@ async def roulette(ctx, color: str, amount: int):
     if color not in ["red", "black"]:
         return await ctx.send("Please choose a color: `red` or `black`.")
 
-    data = await read_json(DATA_FILE, data_lock)
-    user = data[str(ctx.author.id)]
+    async with user_locks.hold(ctx.author.id):
+        data = await read_json(DATA_FILE, data_lock)
+        user = data[str(ctx.author.id)]
 
-    if amount > user["bank_points"] or amount <= 0:
-        return await ctx.send("Invalid amount.")
+        if amount > user["bank_points"] or amount <= 0:
+            return await ctx.send("Invalid amount.")
 
-    result = random.choice(["red", "black"])
-    if result == color:
-        user["bank_points"] += amount
-        await ctx.send(f"🎡 The wheel landed on {result.upper()}! You won +${amount}!")
-    else:
-        user["bank_points"] -= amount
-        await ctx.send(f"🎡 The wheel landed on {result.upper()}! You lost -${amount}.")
+        result = random.choice(["red", "black"])
+        if result == color:
+            adjust_balance(data, str(ctx.author.id), amount, "roulette")
+            await ctx.send(f"🎡 The wheel landed on {result.upper()}! You won +${amount}!")
+        else:
+            adjust_balance(data, str(ctx.author.id), -amount, "roulette")
+            await ctx.send(f"🎡 The wheel landed on {result.upper()}! You lost -${amount}.")
 
-    await write_json(DATA_FILE, data, data_lock)
+        await write_json(DATA_FILE, data, data_lock, keys=[str(ctx.author.id)])
 
 
 @bot.command()
@@ -916,45 +2860,47 @@ async def dice(ctx, guess: int, amount: int):
     if guess < 1 or guess > 6:
         return await ctx.send("Please guess a number between 1 and 6.")
     
-    data = await read_json(DATA_FILE, data_lock)
-    user = data[str(ctx.author.id)]
-
-    if amount > user["bank_points"] or amount <= 0:
-        return await ctx.send("Invalid amount.")
-
-    roll = random.randint(1, 6)
-    if roll == guess:
-        reward = amount * 5
-        user["bank_points"] += reward
-        await ctx.send(f"🎲 Dice rolled: {roll} | You guessed correctly! +${reward}")
-    else:
-        user["bank_points"] -= amount
-        await ctx.send(f"🎲 Dice rolled: {roll} | You lost -${amount}")
+    async with user_locks.hold(ctx.author.id):
+        data = await read_json(DATA_FILE, data_lock)
+        user = data[str(ctx.author.id)]
+
+        if amount > user["bank_points"] or amount <= 0:
+            return await ctx.send("Invalid amount.")
+
+        roll = random.randint(1, 6)
+        if roll == guess:
+            reward = amount * 5
+            adjust_balance(data, str(ctx.author.id), reward, "dice")
+            await ctx.send(f"🎲 Dice rolled: {roll} | You guessed correctly! +${reward}")
+        else:
+            adjust_balance(data, str(ctx.author.id), -amount, "dice")
+            await ctx.send(f"🎲 Dice rolled: {roll} | You lost -${amount}")
 
-    await write_json(DATA_FILE, data, data_lock)
+        await write_json(DATA_FILE, data, data_lock, keys=[str(ctx.author.id)])
 
 @bot.command()
 @cooldown(1, 60, BucketType.user)  # 1 kullanım, 60 saniye cooldown, kullanıcı bazlı
 async def crime(ctx):
-    await init_user(ctx.author.id)
-    data = await read_json(DATA_FILE, data_lock)
-    user_id = str(ctx.author.id)
+    async with user_locks.hold(ctx.author.id):
+        await init_user(ctx.author.id)
+        data = await read_json(DATA_FILE, data_lock)
+        user_id = str(ctx.author.id)
 
-    if data[user_id]["bank_points"] < 100:
-        return await ctx.send("You need at least $100 to attempt a crime.")
+        if data[user_id]["bank_points"] < 100:
+            return await ctx.send("You need at least $100 to attempt a crime.")
 
-    success = random.random() < 0.5  # %50 başarı şansı
-    amount = random.randint(50, 3500)
+        success = random.random() < 0.5  # %50 başarı şansı
+        amount = random.randint(50, 3500)
 
-    if success:
-        data[user_id]["bank_points"] += amount
-        await ctx.send(f"🚨 Crime successful! You earned ${amount}.")
-    else:
-        penalty = random.randint(20, 700)
-        data[user_id]["bank_points"] = max(0, data[user_id]["bank_points"] - penalty)
-        await ctx.send(f"🚔 You got caught! You lost ${penalty}.")
+        if success:
+            adjust_balance(data, user_id, amount, "crime")
+            await ctx.send(f"🚨 Crime successful! You earned ${amount}.")
+        else:
+            penalty = random.randint(20, 700)
+            adjust_balance(data, user_id, -min(penalty, data[user_id]["bank_points"]), "crime")
+            await ctx.send(f"🚔 You got caught! You lost ${penalty}.")
 
-    await write_json(DATA_FILE, data, data_lock)
+        await write_json(DATA_FILE, data, data_lock, keys=[user_id])
 
 
 @bot.command()
@@ -964,36 +2910,38 @@ async def coinflip(ctx, choice: str, amount: int):
     if choice not in ["heads", "tails"]:
         return await ctx.send("Please choose either `heads` or `tails`.")
 
-    data = await read_json(DATA_FILE, data_lock)
-    user = data[str(ctx.author.id)]
+    async with user_locks.hold(ctx.author.id):
+        data = await read_json(DATA_FILE, data_lock)
+        user = data[str(ctx.author.id)]
 
-    if amount > user["bank_points"] or amount <= 0:
-        return await ctx.send("Invalid amount.")
+        if amount > user["bank_points"] or amount <= 0:
+            return await ctx.send("Invalid amount.")
 
-    result = random.choice(["heads", "tails"])
-    if result == choice:
-        user["bank_points"] += amount
-        await ctx.send(f"🪙 It's {result.upper()}! You won +${amount}.")
-    else:
-        user["bank_points"] -= amount
-        await ctx.send(f"🪙 It's {result.upper()}! You lost -${amount}.")
+        result = random.choice(["heads", "tails"])
+        if result == choice:
+            adjust_balance(data, str(ctx.author.id), amount, "coinflip")
+            await ctx.send(f"🪙 It's {result.upper()}! You won +${amount}.")
+        else:
+            adjust_balance(data, str(ctx.author.id), -amount, "coinflip")
+            await ctx.send(f"🪙 It's {result.upper()}! You lost -${amount}.")
 
-    await write_json(DATA_FILE, data, data_lock)    
+        await write_json(DATA_FILE, data, data_lock, keys=[str(ctx.author.id)])
 
 from datetime import datetime
 
 @bot.command()
 @commands.cooldown(1, 86400, commands.BucketType.user)  # 24 saat bekleme
 async def daily(ctx):
-    await init_user(ctx.author.id)
-    data = await read_json(DATA_FILE, data_lock)
-    user_id = str(ctx.author.id)
+    async with user_locks.hold(ctx.author.id):
+        await init_user(ctx.author.id)
+        data = await read_json(DATA_FILE, data_lock)
+        user_id = str(ctx.author.id)
 
-    reward = random.randint(500, 1000)
-    data[user_id]["bank_points"] += reward
+        reward = random.randint(500, 1000)
+        adjust_balance(data, user_id, reward, "daily")
 
-    await write_json(DATA_FILE, data, data_lock)
-    await ctx.send(f"🎁 You claimed your daily reward of **${reward}**!")
+        await write_json(DATA_FILE, data, data_lock, keys=[user_id])
+        await ctx.send(f"🎁 You claimed your daily reward of **${reward}**!")
 
 SHOP_ITEMS = {
     "coffee": {"price": 500, "description": "Increases work earnings by 10%."},
@@ -1007,13 +2955,13 @@ SHOP_ITEMS = {
 }
 
 INVENTORY_FILE = "MAINUserInventory.json"
-inventory_lock = asyncio.Lock()
+inventory_lock = get_store(INVENTORY_FILE).lock
 
 async def init_inventory(user_id):
     data = await read_json(INVENTORY_FILE, inventory_lock)
     if str(user_id) not in data:
         data[str(user_id)] = {}
-        await write_json(INVENTORY_FILE, data, inventory_lock)
+        await write_json(INVENTORY_FILE, data, inventory_lock, keys=[str(user_id)])
 
 @bot.command()
 async def inventory(ctx):
@@ -1045,25 +2993,25 @@ async def buy(ctx, item_name: str):
     if item_name not in SHOP_ITEMS:
         return await ctx.send("Item not found in shop.")
 
-    await init_user(ctx.author.id)
-    await init_inventory(ctx.author.id)
+    async with user_locks.hold(ctx.author.id):
+        await init_user(ctx.author.id)
+        await init_inventory(ctx.author.id)
 
-    data = await read_json(DATA_FILE, data_lock)
-    inventory = await read_json(INVENTORY_FILE, inventory_lock)
+        async with transaction(DATA_FILE, INVENTORY_FILE, reason="shop_buy") as tx:
+            data = tx[DATA_FILE]
+            inventory = tx[INVENTORY_FILE]
 
-    user_id = str(ctx.author.id)
-    price = SHOP_ITEMS[item_name]["price"]
-
-    if data[user_id]["bank_points"] < price:
-        return await ctx.send("You don't have enough money.")
+            user_id = str(ctx.author.id)
+            price = SHOP_ITEMS[item_name]["price"]
 
-    data[user_id]["bank_points"] -= price
-    inventory[user_id][item_name] = inventory[user_id].get(item_name, 0) + 1
+            if data[user_id]["bank_points"] < price:
+                return await ctx.send("You don't have enough money.")
 
-    await write_json(DATA_FILE, data, data_lock)
-    await write_json(INVENTORY_FILE, inventory, inventory_lock)
+            tx.touch(INVENTORY_FILE, user_id)
+            adjust_balance(data, user_id, -price, "shop_buy")
+            inventory[user_id][item_name] = inventory[user_id].get(item_name, 0) + 1
 
-    await ctx.send(f"You bought 1 {item_name}!")
+        await ctx.send(f"You bought 1 {item_name}!")
 
 @bot.command()
 async def sell(ctx, item_name: str, amount: int):
@@ -1071,33 +3019,33 @@ async def sell(ctx, item_name: str, amount: int):
     if item_name not in SHOP_ITEMS:
         return await ctx.send("Item not found in your inventory.")
 
-    await init_inventory(ctx.author.id)
-    inventory = await read_json(INVENTORY_FILE, inventory_lock)
-
-    user_id = str(ctx.author.id)
+    async with user_locks.hold(ctx.author.id):
+        await init_inventory(ctx.author.id)
+        inventory = await read_json(INVENTORY_FILE, inventory_lock)
 
-    if amount <= 0:
-        return await ctx.send("Invalid amount.")
+        user_id = str(ctx.author.id)
 
-    if inventory.get(user_id, {}).get(item_name, 0) < amount:
-        return await ctx.send("You don't have that many items.")
+        if amount <= 0:
+            return await ctx.send("Invalid amount.")
 
-    await init_user(ctx.author.id)
-    data = await read_json(DATA_FILE, data_lock)
+        if inventory.get(user_id, {}).get(item_name, 0) < amount:
+            return await ctx.send("You don't have that many items.")
 
-    sell_price = SHOP_ITEMS[item_name]["price"] // 2
-    total_price = sell_price * amount
+        await init_user(ctx.author.id)
 
-    inventory[user_id][item_name] -= amount
-    if inventory[user_id][item_name] <= 0:
-        del inventory[user_id][item_name]
+        sell_price = SHOP_ITEMS[item_name]["price"] // 2
+        total_price = sell_price * amount
 
-    data[user_id]["bank_points"] += total_price
+        async with transaction(DATA_FILE, INVENTORY_FILE, reason="shop_sell") as tx:
+            data = tx[DATA_FILE]
+            tx.touch(INVENTORY_FILE, user_id)
+            inventory[user_id][item_name] -= amount
+            if inventory[user_id][item_name] <= 0:
+                del inventory[user_id][item_name]
 
-    await write_json(DATA_FILE, data, data_lock)
-    await write_json(INVENTORY_FILE, inventory, inventory_lock)
+            adjust_balance(data, user_id, total_price, "shop_sell")
 
-    await ctx.send(f"You sold {amount} {item_name}(s) for ${total_price}.")
+        await ctx.send(f"You sold {amount} {item_name}(s) for ${total_price}.")
 
 
 trade_offers = {}
@@ -1132,17 +3080,18 @@ async def accept(ctx):
     from_id = offer["from"]
     amount = offer["amount"]
 
-    data = await read_json(DATA_FILE, data_lock)
+    async with user_locks.hold(from_id, user_id):
+        data = await read_json(DATA_FILE, data_lock)
 
-    if data[from_id]["bank_points"] < amount:
-        return await ctx.send("The offerer no longer has enough money.")
+        if data[from_id]["bank_points"] < amount:
+            return await ctx.send("The offerer no longer has enough money.")
 
-    data[from_id]["bank_points"] -= amount
-    data[user_id]["bank_points"] += amount
+        adjust_balance(data, from_id, -amount, "trade")
+        adjust_balance(data, user_id, amount, "trade")
 
-    await write_json(DATA_FILE, data, data_lock)
+        await write_json(DATA_FILE, data, data_lock, keys=[from_id, user_id])
 
-    await ctx.send(f"Trade accepted! {ctx.author.mention} received ${amount} from <@{from_id}>.")
+        await ctx.send(f"Trade accepted! {ctx.author.mention} received ${amount} from <@{from_id}>.")
 
 @bot.command()
 async def decline(ctx):
@@ -1155,7 +3104,7 @@ async def decline(ctx):
 
 # Kullanıcı statları için JSON dosyası
 STATS_FILE = "MAINUserStats.json"
-stats_lock = asyncio.Lock()
+stats_lock = get_store(STATS_FILE).lock
 
 async def init_stats(user_id):
     data = await read_json(STATS_FILE, stats_lock)
@@ -1166,84 +3115,88 @@ async def init_stats(user_id):
             "level": 1,
             "xp": 0
         }
-        await write_json(STATS_FILE, data, stats_lock)
+        await write_json(STATS_FILE, data, stats_lock, keys=[str(user_id)])
 
 @bot.command()
 @cooldown(1, 30, BucketType.user)  # 1 kullanım, 30 saniye cooldown, kullanıcı bazlı
 async def workout(ctx):
-    await init_stats(ctx.author.id)  # stats için kayıt oluştur
-    stats = await read_json(STATS_FILE, stats_lock)
-    user_id = str(ctx.author.id)
+    async with user_locks.hold(ctx.author.id):
+        await init_stats(ctx.author.id)  # stats için kayıt oluştur
+        stats = await read_json(STATS_FILE, stats_lock)
+        user_id = str(ctx.author.id)
 
-    # XP kazan
-    gained_xp = random.randint(10, 20)
-    stats[user_id]["xp"] += gained_xp
+        # XP kazan
+        gained_xp = random.randint(10, 20)
+        stats[user_id]["xp"] += gained_xp
 
-    leveled_up = False
-    if stats[user_id]["xp"] >= 100:
-        stats[user_id]["xp"] -= 100
-        stats[user_id]["level"] += 1
-        stats[user_id]["strength"] += 1
-        stats[user_id]["endurance"] += 1
-        leveled_up = True
+        leveled_up = False
+        if stats[user_id]["xp"] >= 100:
+            stats[user_id]["xp"] -= 100
+            stats[user_id]["level"] += 1
+            stats[user_id]["strength"] += 1
+            stats[user_id]["endurance"] += 1
+            leveled_up = True
 
-    await write_json(STATS_FILE, stats, stats_lock)
+        await write_json(STATS_FILE, stats, stats_lock, keys=[user_id])
 
-    msg = f"🏋️ You worked out and gained {gained_xp} XP!"
-    if leveled_up:
-        msg += f"\n🎉 You leveled up to level {stats[user_id]['level']}! Strength and Endurance increased!"
+        msg = f"🏋️ You worked out and gained {gained_xp} XP!"
+        if leveled_up:
+            msg += f"\n🎉 You leveled up to level {stats[user_id]['level']}! Strength and Endurance increased!"
 
-    await ctx.send(msg)
+        await ctx.send(msg)
 
 
 @bot.command()
 @cooldown(1, 120, BucketType.user)  # 1 kullanım, 120 saniye, kullanıcıya özel
 async def work(ctx):
-    await init_user(ctx.author.id)
-    await init_stats(ctx.author.id)        # Statları başlat
-    await init_inventory(ctx.author.id)    # Envanteri başlat
-
-    data = await read_json(DATA_FILE, data_lock)
-    stats = await read_json(STATS_FILE, stats_lock)
-    inventory = await read_json(INVENTORY_FILE, inventory_lock)
-
-    user_id = str(ctx.author.id)
-
-    base_earned = random.randint(250, 540)
-    strength_multiplier = stats[user_id]["strength"]
-
-    # Item bazlı bonus
-    item_bonus_percent = 0
-    user_items = inventory.get(user_id, {})
-
-    if "coffee" in user_items:
-        item_bonus_percent += 0.10
-    if "laptop" in user_items:
-        item_bonus_percent += 0.50
-    if "car" in user_items:
-        item_bonus_percent += 3.50
-    if "briefcase" in user_items:
-        item_bonus_percent += 2.00
-    if "suit" in user_items:
-        item_bonus_percent += 1.00
-    if "watch" in user_items:
-        item_bonus_percent += 0.25
-    if "smartphone" in user_items:
-        item_bonus_percent += 1.20
-    if "assistant" in user_items:
-        item_bonus_percent += 5.00
-
-    total_multiplier = strength_multiplier * (1 + item_bonus_percent)
-    earned = int(base_earned * total_multiplier)
-
-    data[user_id]["bank_points"] += earned
-
-    await write_json(DATA_FILE, data, data_lock)
-
-    await ctx.send(f"🛠️ You worked hard and earned **${earned}**! (Base: ${base_earned}, Multiplier: x{total_multiplier:.2f})")
+    async with user_locks.hold(ctx.author.id):
+        await init_user(ctx.author.id)
+        await init_stats(ctx.author.id)        # Statları başlat
+        await init_inventory(ctx.author.id)    # Envanteri başlat
+
+        data = await read_json(DATA_FILE, data_lock)
+        stats = await read_json(STATS_FILE, stats_lock)
+        inventory = await read_json(INVENTORY_FILE, inventory_lock)
+
+        user_id = str(ctx.author.id)
+
+        base_earned = random.randint(250, 540)
+        strength_multiplier = stats[user_id]["strength"]
+
+        # Item bazlı bonus
+        item_bonus_percent = 0
+        user_items = inventory.get(user_id, {})
+
+        if "coffee" in user_items:
+            item_bonus_percent += 0.10
+        if "laptop" in user_items:
+            item_bonus_percent += 0.50
+        if "car" in user_items:
+            item_bonus_percent += 3.50
+        if "briefcase" in user_items:
+            item_bonus_percent += 2.00
+        if "suit" in user_items:
+            item_bonus_percent += 1.00
+        if "watch" in user_items:
+            item_bonus_percent += 0.25
+        if "smartphone" in user_items:
+            item_bonus_percent += 1.20
+        if "assistant" in user_items:
+            item_bonus_percent += 5.00
+
+        total_multiplier = strength_multiplier * (1 + item_bonus_percent)
+        earned = int(base_earned * total_multiplier)
+
+        adjust_balance(data, user_id, earned, "work")
+
+        await write_json(DATA_FILE, data, data_lock, keys=[user_id])
+
+        await ctx.send(f"🛠️ You worked hard and earned **${earned}**! (Base: ${base_earned}, Multiplier: x{total_multiplier:.2f})")
 
 GUARD_FILE = "MAINGuards.json"
-guard_lock = asyncio.Lock()
+guard_lock = get_store(GUARD_FILE).lock
+ZONE_FILE = "MAINZoneSlots.json"
+zone_lock = get_store(ZONE_FILE).lock
 GUARD_PRICE = 4500
 GUARD_LIMIT = 25
 
@@ -1253,104 +3206,103 @@ async def init_guards(user_id):
         guards[str(user_id)] = {
             "guards": 0
         }
-        await write_json(GUARD_FILE, guards, guard_lock)
+        await write_json(GUARD_FILE, guards, guard_lock, keys=[str(user_id)])
 
 user_zones = {}
 
 @bot.command()
 async def buyguard(ctx, amount: int = 1, guard_type: str = "normal"):
     user_id = str(ctx.author.id)
-    await init_user(user_id)
-
-    guard_type = guard_type.lower()
-    if guard_type not in ["normal", "shielder", "sniper"]:
-        return await ctx.send("❌ Invalid guard type. Choose one: `normal`, `shielder`, or `sniper`.")
-
-    # Bölge slotlarını oku (5, 10 veya 15 olabilir)
-    zoneslots = await read_json("MAINZoneSlots.json", asyncio.Lock())
-    zone_count = zoneslots.get(user_id, 5)
-
-    # Maksimum koruma sayısını bölge sayısına göre hesapla
-    if zone_count == 5:
-        max_guards = 25
-    elif zone_count == 10:
-        max_guards = 65
-    elif zone_count == 15:
-        max_guards = 95
-    elif zone_count == 20:
-        max_guards = 135
-    else:
-        max_guards = 25  # fallback
-
-    guard_prices = {
-        "normal": 4500,
-        "shielder": 9000,
-        "sniper": 12000
-    }
-    cost_per_guard = guard_prices[guard_type]
-    total_cost = cost_per_guard * amount
+    async with user_locks.hold(user_id):
+        await init_user(user_id)
+
+        guard_type = guard_type.lower()
+        if guard_type not in ["normal", "shielder", "sniper"]:
+            return await ctx.send("❌ Invalid guard type. Choose one: `normal`, `shielder`, or `sniper`.")
+
+        # Bölge slotlarını oku (5, 10 veya 15 olabilir)
+        zoneslots = await read_json(ZONE_FILE, zone_lock)
+        zone_count = zoneslots.get(user_id, 5)
+
+        # Maksimum koruma sayısını bölge sayısına göre hesapla
+        if zone_count == 5:
+            max_guards = 25
+        elif zone_count == 10:
+            max_guards = 65
+        elif zone_count == 15:
+            max_guards = 95
+        elif zone_count == 20:
+            max_guards = 135
+        else:
+            max_guards = 25  # fallback
 
-    guards = await read_json("MAINGuards.json", asyncio.Lock())
-    bank = await read_json(DATA_FILE, data_lock)
+        guard_prices = {
+            "normal": 4500,
+            "shielder": 9000,
+            "sniper": 12000
+        }
+        cost_per_guard = guard_prices[guard_type]
+        total_cost = cost_per_guard * amount
 
-    current_guard_count = len(guards.get(user_id, []))
+        async with transaction(DATA_FILE, GUARD_FILE, reason="buy_guard") as tx:
+            guards = tx[GUARD_FILE]
+            bank = tx[DATA_FILE]
 
-    if current_guard_count >= max_guards:
-        return await ctx.send(f"🛡️ You already have the maximum number of guards ({max_guards}) for your zones.")
+            current_guard_count = len(guards.get(user_id, []))
 
-    if bank[user_id]["bank_points"] < total_cost:
-        return await ctx.send(f"💸 You don't have enough money. Total cost: ${total_cost:,}")
+            if current_guard_count >= max_guards:
+                return await ctx.send(f"🛡️ You already have the maximum number of guards ({max_guards}) for your zones.")
 
-    bank[user_id]["bank_points"] -= total_cost
+            if bank[user_id]["bank_points"] < total_cost:
+                return await ctx.send(f"💸 You don't have enough money. Total cost: ${total_cost:,}")
 
-    import random
-    guards.setdefault(user_id, [])
-    added = 0
-    for _ in range(amount):
-        if len(guards[user_id]) >= max_guards:
-            break
-        # Bölge numarasını 1 ile zone_count arasında ata
-        guards[user_id].append({
-            "zone": random.randint(1, zone_count),
-            "type": guard_type
-        })
-        added += 1
+            tx.touch(GUARD_FILE, user_id)
+            adjust_balance(bank, user_id, -total_cost, "buy_guard")
 
-    await write_json("MAINGuards.json", guards, asyncio.Lock())
-    await write_json(DATA_FILE, bank, data_lock)
+            import random
+            guards.setdefault(user_id, [])
+            added = 0
+            for _ in range(amount):
+                if len(guards[user_id]) >= max_guards:
+                    break
+                # Bölge numarasını 1 ile zone_count arasında ata
+                guards[user_id].append({
+                    "zone": random.randint(1, zone_count),
+                    "type": guard_type
+                })
+                added += 1
 
-    await ctx.send(f"🛡️ You hired {added} `{guard_type}` guard(s) for ${total_cost:,}. Max guards for your zones: {max_guards}")
+        await ctx.send(f"🛡️ You hired {added} `{guard_type}` guard(s) for ${total_cost:,}. Max guards for your zones: {max_guards}")
 
 
 @bot.command()
 async def buyzoneslot(ctx, slot: int):
     user_id = str(ctx.author.id)
-    bank = await read_json(DATA_FILE, data_lock)
-    zoneslots = await read_json("MAINZoneSlots.json", asyncio.Lock())
+    async with user_locks.hold(user_id), transaction(DATA_FILE, ZONE_FILE, reason="buy_zone_slot") as tx:
+        bank = tx[DATA_FILE]
+        zoneslots = tx[ZONE_FILE]
 
-    if slot not in [10, 15, 20]:
-        return await ctx.send("❌ You can only buy `10`, `15` or '20' zone slots.")
+        if slot not in [10, 15, 20]:
+            return await ctx.send("❌ You can only buy `10`, `15` or '20' zone slots.")
 
-    current_slot = zoneslots.get(user_id, 5)
+        current_slot = zoneslots.get(user_id, 5)
 
-    if current_slot >= slot:
-        return await ctx.send(f"🛑 You already have {slot} or more zones.")
+        if current_slot >= slot:
+            return await ctx.send(f"🛑 You already have {slot} or more zones.")
 
     
-    if slot == 10:
-        price = 150000
-    elif slot == 15:
-        price = 350000
-    elif slot == 20:
-        price = 750000
-    if bank[user_id]["bank_points"] < price:
-        return await ctx.send(f"💸 You need ${price} for this transaction.")
-
-    bank[user_id]["bank_points"] -= price
-    zoneslots[user_id] = slot
-
-    await write_json(DATA_FILE, bank, data_lock)
-    await write_json("MAINZoneSlots.json", zoneslots, asyncio.Lock())
+        if slot == 10:
+            price = 150000
+        elif slot == 15:
+            price = 350000
+        elif slot == 20:
+            price = 750000
+        if bank[user_id]["bank_points"] < price:
+            return await ctx.send(f"💸 You need ${price} for this transaction.")
+
+        tx.touch(ZONE_FILE, user_id)
+        adjust_balance(bank, user_id, -price, "buy_zone_slot")
+        zoneslots[user_id] = slot
 
     await ctx.send(f"✅ You now own {slot} zones! This also grants you more guard slots.")
 
@@ -1358,7 +3310,7 @@ async def buyzoneslot(ctx, slot: int):
 @bot.command()
 async def zones(ctx):
     user_id = str(ctx.author.id)
-    zoneslots = await read_json("MAINZoneSlots.json", asyncio.Lock())
+    zoneslots = await read_json(ZONE_FILE, zone_lock)
     slot = zoneslots.get(user_id, 5)
     await ctx.send(f"🗺️ You currently own {slot} zones.")
 
@@ -1366,8 +3318,8 @@ async def zones(ctx):
 @bot.command()
 async def guards(ctx):
     user_id = str(ctx.author.id)
-    guards = await read_json("MAINGuards.json", asyncio.Lock())
-    zoneslots = await read_json("MAINZoneSlots.json", asyncio.Lock())
+    guards = await read_json(GUARD_FILE, guard_lock)
+    zoneslots = await read_json(ZONE_FILE, zone_lock)
 
     if user_id not in guards or not guards[user_id]:
         return await ctx.send("🛡️ You don't have any guards.")
@@ -1398,6 +3350,11 @@ ASSASSIN_TYPES = {
 }
 
 
+BOUNTY_FILE = "MAINBounties.json"
+bounty_lock = get_store(BOUNTY_FILE).lock
+ASSASSINATION_STATS_FILE = "MAINAssassinationStats.json"
+assassination_stats_lock = get_store(ASSASSINATION_STATS_FILE).lock
+
 assassination_state = {}  # user_id -> suikast bilgisi
 
 @bot.command()
@@ -1419,50 +3376,51 @@ async def assassinate(ctx, target: discord.Member, method: str):
     team_size = ASSASSIN_TYPES[method]["team_size"]
     cost = ASSASSIN_TYPES[method]["cost"]
 
-    bank = await read_json(DATA_FILE, data_lock)
-    if bank.get(attacker_id, {}).get("bank_points", 0) < cost:
-        return await ctx.send(f"💸 You need ${cost:,} to start this assassination.")
-
-    bank[attacker_id]["bank_points"] -= cost
-    await write_json(DATA_FILE, bank, data_lock)
-
-    # Hedefin bölge sayısını oku
-    zone_data = await read_json("MAINZoneSlots.json", asyncio.Lock())
-    region_count = zone_data.get(target_id, 5)
-
-    # Koruma listesini oku
-    guards_data = await read_json("MAINGuards.json", asyncio.Lock())
-    target_guards = guards_data.get(target_id, [])
-
-    # Koruma bölgelerini oluştur
-    zones = [[] for _ in range(region_count)]
-    for guard in target_guards:
-        zone = guard.get("zone", random.randint(1, region_count))
-        zone = max(1, min(zone, region_count))
-        if len(zones[zone - 1]) < 5:
-            zones[zone - 1].append(guard)
-
-    # 🟡 RAID DURUMU OLUŞTUR
-    active_raids[attacker_id] = {
-        "target_id": target_id,
-        "team_size": team_size,
-        "team_alive": team_size,
-        "zones": zones,
-        "current_zone": 0,
-        "phase": "choose_tactic"
-    }
+    async with user_locks.hold(attacker_id):
+        bank = await read_json(DATA_FILE, data_lock)
+        if bank.get(attacker_id, {}).get("bank_points", 0) < cost:
+            return await ctx.send(f"💸 You need ${cost:,} to start this assassination.")
+
+        adjust_balance(bank, attacker_id, -cost, "assassination")
+        await write_json(DATA_FILE, bank, data_lock, keys=[attacker_id])
+
+        # Hedefin bölge sayısını oku
+        zone_data = await read_json(ZONE_FILE, zone_lock)
+        region_count = zone_data.get(target_id, 5)
+
+        # Koruma listesini oku
+        guards_data = await read_json(GUARD_FILE, guard_lock)
+        target_guards = guards_data.get(target_id, [])
+
+        # Koruma bölgelerini oluştur
+        zones = [[] for _ in range(region_count)]
+        for guard in target_guards:
+            zone = guard.get("zone", random.randint(1, region_count))
+            zone = max(1, min(zone, region_count))
+            if len(zones[zone - 1]) < 5:
+                zones[zone - 1].append(guard)
+
+        # 🟡 RAID DURUMU OLUŞTUR
+        active_raids[attacker_id] = {
+            "target_id": target_id,
+            "team_size": team_size,
+            "team_alive": team_size,
+            "zones": zones,
+            "current_zone": 0,
+            "phase": "choose_tactic"
+        }
 
-    # 🟢 İSTATİSTİK: Giriş denemesi olarak kaydet
-    data = await read_json("MAINAssassinationStats.json", asyncio.Lock())
-    data.setdefault(attacker_id, {"attempts": 0, "success": 0, "fails": 0})
-    data[attacker_id]["attempts"] += 1
-    await write_json("MAINAssassinationStats.json", data, asyncio.Lock())
+        # 🟢 İSTATİSTİK: Giriş denemesi olarak kaydet
+        data = await read_json(ASSASSINATION_STATS_FILE, assassination_stats_lock)
+        data.setdefault(attacker_id, {"attempts": 0, "success": 0, "fails": 0})
+        data[attacker_id]["attempts"] += 1
+        await write_json(ASSASSINATION_STATS_FILE, data, assassination_stats_lock, keys=[attacker_id])
 
-    await ctx.send(
-        f"🚨 {ctx.author.mention}, you started a `{method}` assassination on {target.mention}!\n"
-        f"🗺️ Target has `{region_count}` defensive zones.\n"
-        f"Choose your tactic for zone 1: `!tactic siper` or `!tactic charge`"
-    )
+        await ctx.send(
+            f"🚨 {ctx.author.mention}, you started a `{method}` assassination on {target.mention}!\n"
+            f"🗺️ Target has `{region_count}` defensive zones.\n"
+            f"Choose your tactic for zone 1: `!tactic siper` or `!tactic charge`"
+        )
 
 
 
@@ -1470,34 +3428,43 @@ async def wipe_user(user_id, killer_id=None, channel=None):
     user_id = str(user_id)
     killer_id = str(killer_id) if killer_id else None
 
-    # Ödül verisi
-    bounties = await read_json("MAINBounties.json", asyncio.Lock())
-
-    # Eğer bu oyuncunun başında ödül varsa ve biri öldürdüyse, parayı ona ver
-    if killer_id and user_id in bounties:
-        reward = bounties.pop(user_id)
-        bank = await read_json(DATA_FILE, data_lock)
-        bank.setdefault(killer_id, {"bank_points": 0})
-        bank[killer_id]["bank_points"] += reward
-        await write_json(DATA_FILE, bank, data_lock)
-        await write_json("MAINBounties.json", bounties, asyncio.Lock())
-
-        if channel:
-            await channel.send(f"💰 <@{killer_id}> earned a **${reward:,}** bounty for eliminating <@{user_id}>!")
-
-    # Oyuncunun tüm verilerini sil
-    for path, lock in [
-        (DATA_FILE, data_lock),
-        (COMPANY_FILE, company_lock),
-        ("MAINInventory.json", asyncio.Lock()),
-        (USER_STOCK_FILE, user_stock_lock),
-        ("MAINGuards.json", asyncio.Lock()),
-        ("MAINZoneSlots.json", asyncio.Lock())
-    ]:
-        data = await read_json(path, lock)
-        if user_id in data:
-            del data[user_id]
-            await write_json(path, data, lock)
+    async with user_locks.hold(user_id, killer_id):
+        # Ödül verisi
+        bounties = await read_json(BOUNTY_FILE, bounty_lock)
+
+        # Eğer bu oyuncunun başında ödül varsa ve biri öldürdüyse, parayı ona ver
+        if killer_id and user_id in bounties:
+            reward = bounties.pop(user_id)
+            bank = await read_json(DATA_FILE, data_lock)
+            bank.setdefault(killer_id, {"bank_points": 0})
+            adjust_balance(bank, killer_id, reward, "bounty_reward")
+            await write_json(DATA_FILE, bank, data_lock, keys=[killer_id])
+            await write_json(BOUNTY_FILE, bounties, bounty_lock, keys=[user_id])
+
+            if channel:
+                await channel.send(f"💰 <@{killer_id}> earned a **${reward:,}** bounty for eliminating <@{user_id}>!")
+
+        # Açık emirler de silinir; yığındaki kayıtları çıkarken atlanır, emanet geri verilmez
+        orders = await read_json(ORDER_FILE, order_lock)
+        order_ids = [order_id for order_id, order in orders.items() if order["user"] == user_id]
+        for order_id in order_ids:
+            del orders[order_id]
+        if order_ids:
+            await write_json(ORDER_FILE, orders, order_lock, keys=order_ids)
+
+        # Oyuncunun tüm verilerini sil
+        for path, lock in [
+            (DATA_FILE, data_lock),
+            (COMPANY_FILE, company_lock),
+            (INVENTORY_FILE, inventory_lock),
+            (USER_STOCK_FILE, user_stock_lock),
+            (GUARD_FILE, guard_lock),
+            (ZONE_FILE, zone_lock)
+        ]:
+            data = await read_json(path, lock)
+            if user_id in data:
+                del data[user_id]
+                await write_json(path, data, lock, keys=[user_id])
 
 
 
@@ -1527,10 +3494,10 @@ async def process_raid_zone(channel, user_id):
         await wipe_user(target_id, killer_id=user_id, channel=channel)
         active_raids.pop(user_id, None)
                 # İSTATİSTİK: başarı
-        data = await read_json("MAINAssassinationStats.json", asyncio.Lock())
+        data = await read_json(ASSASSINATION_STATS_FILE, assassination_stats_lock)
         data.setdefault(user_id, {"attempts": 0, "success": 0, "fails": 0})
         data[user_id]["success"] += 1
-        await write_json("MAINAssassinationStats.json", data, asyncio.Lock())
+        await write_json(ASSASSINATION_STATS_FILE, data, assassination_stats_lock, keys=[user_id])
         return
 
     zone_guards = zones[current_zone]
@@ -1579,10 +3546,10 @@ async def process_raid_zone(channel, user_id):
             await channel.send("☠️ All your teammates died during the assault. Mission failed!")
             await wipe_user(user_id)
                         # İSTATİSTİK: başarısızlık
-            data = await read_json("MAINAssassinationStats.json", asyncio.Lock())
+            data = await read_json(ASSASSINATION_STATS_FILE, assassination_stats_lock)
             data.setdefault(user_id, {"attempts": 0, "success": 0, "fails": 0})
             data[user_id]["fails"] += 1
-            await write_json("MAINAssassinationStats.json", data, asyncio.Lock())
+            await write_json(ASSASSINATION_STATS_FILE, data, assassination_stats_lock, keys=[user_id])
             active_raids.pop(user_id, None)
             return
 
@@ -1596,10 +3563,10 @@ async def process_raid_zone(channel, user_id):
             await channel.send(f"❌ Your tactic failed and you lost your entire team in zone {current_zone+1}. Mission failed!")
             await wipe_user(user_id)
                         # İSTATİSTİK: başarısızlık
-            data = await read_json("MAINAssassinationStats.json", asyncio.Lock())
+            data = await read_json(ASSASSINATION_STATS_FILE, assassination_stats_lock)
             data.setdefault(user_id, {"attempts": 0, "success": 0, "fails": 0})
             data[user_id]["fails"] += 1
-            await write_json("MAINAssassinationStats.json", data, asyncio.Lock())
+            await write_json(ASSASSINATION_STATS_FILE, data, assassination_stats_lock, keys=[user_id])
             active_raids.pop(user_id, None)
             return
 
@@ -1688,14 +3655,15 @@ async def on_message(message):
             if doubled:
                 return await channel.send("❌ You can only double once at the start.")
 
-            data = await read_json(DATA_FILE, data_lock)
-            bet = game["bet"]
+            async with user_locks.hold(user_id):
+                data = await read_json(DATA_FILE, data_lock)
+                bet = game["bet"]
 
-            if data[user_id]["bank_points"] < bet:
-                return await channel.send("💸 You don't have enough money to double.")
+                if data[user_id]["bank_points"] < bet:
+                    return await channel.send("💸 You don't have enough money to double.")
 
-            data[user_id]["bank_points"] -= bet
-            await write_json(DATA_FILE, data, data_lock)
+                adjust_balance(data, user_id, -bet, "blackjack")
+                await write_json(DATA_FILE, data, data_lock, keys=[user_id])
 
             player.append(draw())
             game["doubled"] = True
@@ -1724,35 +3692,34 @@ async def bounty(ctx, target: discord.Member, amount: int):
     if amount < 10000:
         return await ctx.send("💸 You must place a bounty of at least $10,000.")
 
-    bank = await read_json(DATA_FILE, data_lock)
-
-    if bank[user_id]["bank_points"] < amount:
-        return await ctx.send(f"❌ You don’t have enough money. Required: ${amount:,}")
+    async with user_locks.hold(user_id, target_id), transaction(DATA_FILE, BOUNTY_FILE, reason="bounty") as tx:
+        bank = tx[DATA_FILE]
 
-    # Bounty data
-    bounties = await read_json("MAINBounties.json", asyncio.Lock())
-    bounties[target_id] = bounties.get(target_id, 0) + amount
+        if bank[user_id]["bank_points"] < amount:
+            return await ctx.send(f"❌ You don’t have enough money. Required: ${amount:,}")
 
-    # Deduct money
-    bank[user_id]["bank_points"] -= amount
+        # Bounty data
+        bounties = tx[BOUNTY_FILE]
+        tx.touch(BOUNTY_FILE, target_id)
+        bounties[target_id] = bounties.get(target_id, 0) + amount
 
-    await write_json("MAINBounties.json", bounties, asyncio.Lock())
-    await write_json(DATA_FILE, bank, data_lock)
+        # Deduct money
+        adjust_balance(bank, user_id, -amount, "bounty")
 
     await ctx.send(f"💰 {ctx.author.mention} placed a **${amount:,}** bounty on {target.mention}!")
 
 
 @bot.command()
 async def bounties(ctx):
-    bounties = await read_json("MAINBounties.json", asyncio.Lock())
+    bounties = await read_json(BOUNTY_FILE, bounty_lock)
     if not bounties:
         return await ctx.send("🔍 There are currently no active bounties.")
 
-    sorted_bounties = sorted(bounties.items(), key=lambda x: x[1], reverse=True)
+    sorted_bounties = sorted(bounties.items(), key=lambda x: x[1], reverse=True)[:10]
+    names = await name_resolver.names([user_id for user_id, _ in sorted_bounties], ctx.guild)
     description = ""
-    for user_id, amount in sorted_bounties[:10]:
-        member = ctx.guild.get_member(int(user_id))
-        name = member.display_name if member else f"<@{user_id}>"
+    for user_id, amount in sorted_bounties:
+        name = names[user_id] or f"<@{user_id}>"
         description += f"🎯 {name}: **${amount:,}**\n"
 
     embed = discord.Embed(title="🏆 Active Bounties", description=description, color=0xff4444)
@@ -1764,7 +3731,7 @@ async def attempted_assassinations(ctx, member: discord.Member = None):
     user = member or ctx.author
     user_id = str(user.id)
 
-    data = await read_json("MAINAssassinationStats.json", asyncio.Lock())
+    data = await read_json(ASSASSINATION_STATS_FILE, assassination_stats_lock)
     stats = data.get(user_id, {"attempts": 0, "success": 0, "fails": 0})
 
     embed = discord.Embed(
@@ -1778,6 +3745,104 @@ async def attempted_assassinations(ctx, member: discord.Member = None):
     await ctx.send(embed=embed)
 
 
+# Komut gecikmeleri: before/after_invoke arasında geçen süre komut adına göre tutulur
+command_timings = {}  # komut adı -> Histogram
+command_errors = {}
+
+@bot.before_invoke
+async def before_command(ctx):
+    ctx.perf_started = time.perf_counter()
+    name_resolver.put(str(ctx.author.id), ctx.author.name)
+    # Biriken gelir komut bakiyeye dokunmadan önce ödenir
+    if INCOME_MODE == "accrual":
+        await settle_users([str(ctx.author.id)])
+
+@bot.after_invoke
+async def stop_command_timer(ctx):
+    started = getattr(ctx, "perf_started", None)
+    if started is None:
+        return
+    name = ctx.command.qualified_name
+    command_timings.setdefault(name, Histogram()).observe(time.perf_counter() - started)
+    if ctx.command_failed:
+        command_errors[name] = command_errors.get(name, 0) + 1
+
+
+def prometheus_metrics():
+    lines = []
+    for path, store in stores.items():
+        labels = f'store="{path}"'
+        for name, value in store.stats.items():
+            lines.append(f"economy_store_{name}_total{{{labels}}} {value}")
+        for name, histogram in store.timings.items():
+            lines += histogram.prometheus(f"economy_store_{name}_seconds", labels)
+    for name, histogram in command_timings.items():
+        labels = f'command="{name}"'
+        lines += histogram.prometheus("economy_command_seconds", labels)
+        lines.append(f"economy_command_errors_total{{{labels}}} {command_errors.get(name, 0)}")
+    for phase, histogram in tick_timings.items():
+        lines += histogram.prometheus("economy_tick_phase_seconds", f'phase="{phase}"')
+    lines.append(f"economy_ticks_total {tick_state['ticks']}")
+    lines.append(f"economy_tick_errors_total {tick_state['errors']}")
+    lines.append(f"economy_journal_seq {state_journal.seq}")
+    lines.append(f"economy_journal_entries {state_journal.entries}")
+    return "\n".join(lines) + "\n"
+
+# PERF_METRICS_FILE verilirse metrikler Prometheus metin formatında bu dosyaya yazılır
+# (node_exporter textfile collector ile okunabilir)
+PERF_METRICS_FILE = os.getenv("PERF_METRICS_FILE", "")
+PERF_METRICS_INTERVAL = float(os.getenv("PERF_METRICS_INTERVAL", "60"))
+
+async def dump_metrics():
+    await asyncio.to_thread(atomic_write, PERF_METRICS_FILE, prometheus_metrics())
+
+@tasks.loop(seconds=PERF_METRICS_INTERVAL)
+async def perf_metrics_loop():
+    await dump_metrics()
+
+
+@bot.command()
+@commands.is_owner()
+async def perfstats(ctx):
+    embed = discord.Embed(title="⏱️ Performance Stats", color=0x5865F2)
+
+    for path, store in stores.items():
+        if store.data is None:
+            continue
+        stats, timings = store.stats, store.timings
+        hit_rate = stats["hits"] / stats["reads"] * 100 if stats["reads"] else 0
+        value = (
+            f"reads {stats['reads']:,} ({hit_rate:.0f}% hit) · writes {stats['writes']:,} · flushes {stats['flushes']:,}\n"
+            f"read {stats['read_bytes']:,} B · journal {stats['journal_bytes']:,} B · flushed {stats['flushed_bytes']:,} B\n"
+            f"parse p50 {format_latency(timings['parse'].quantile(0.5))} · "
+            f"dump p50 {format_latency(timings['dump'].quantile(0.5))} p99 {format_latency(timings['dump'].quantile(0.99))}\n"
+            f"write p99 {format_latency(timings['write'].quantile(0.99))} · "
+            f"lock wait p99 {format_latency(timings['lock_wait'].quantile(0.99))} ({stats['lock_waits']} waits)"
+        )
+        embed.add_field(name=f"🗄️ {path}", value=value, inline=False)
+
+    busiest = sorted(command_timings.items(), key=lambda item: item[1].count, reverse=True)[:10]
+    lines = [
+        f"`!{name}` ×{h.count} p50 {format_latency(h.quantile(0.5))} p99 {format_latency(h.quantile(0.99))}"
+        + (f" ({command_errors[name]} failed)" if command_errors.get(name) else "")
+        for name, h in busiest
+    ]
+    embed.add_field(name="⌨️ Commands", value="\n".join(lines) or "No commands yet.", inline=False)
+
+    phases = [
+        f"{phase} p50 {format_latency(h.quantile(0.5))} p99 {format_latency(h.quantile(0.99))}"
+        for phase, h in tick_timings.items() if h.count
+    ]
+    embed.add_field(
+        name=f"🔁 Economy tick ×{tick_state['ticks']} (last {tick_state['last_duration'] * 1000:.1f}ms, {tick_state['errors']} errors)",
+        value="\n".join(phases) or "No ticks yet.",
+        inline=False
+    )
+    embed.set_footer(text=f"backend={storage.name} · journal seq {state_journal.seq} · "
+                          f"{state_journal.entries} entries since checkpoint")
+    await ctx.send(embed=embed)
+
+
 @bot.command()
 async def commands(ctx):
     embed = discord.Embed(
@@ -1791,7 +3856,12 @@ async def commands(ctx):
     embed.add_field(name="🏢 !createcompany <name>", value="Start your own company (costs $150,000).", inline=False)
     embed.add_field(name="⬆️ !upgradeoffice", value="Upgrade your company office for more employees.", inline=False)
     embed.add_field(name="👨‍💼 !hire", value="Hire a new employee (costs $2,000).", inline=False)
-    embed.add_field(name="📈 !buystock <company>", value="Buy a company's stock.", inline=False)
+    embed.add_field(name="📈 !buystock <company> <amount> [limit/stop] [price]", value="Buy a company's stock now or with a limit/stop order.", inline=False)
+    embed.add_field(name="📋 !orders / !cancelorder <id>", value="List or cancel your open stock orders.", inline=False)
+    embed.add_field(name="🕯️ !chart <stock> [1h/1d]", value="Show a stock's recent price candles.", inline=False)
+    embed.add_field(name="🏦 !networth", value="Net worth leaderboard: cash, stocks and companies minus loans.", inline=False)
+    if INCOME_MODE == "accrual":
+        embed.add_field(name="💼 Company income", value="Company and stock income keeps accruing while you're offline and is paid out when you use any command.", inline=False)
     embed.add_field(name="🛠️ !work", value="Work to earn money (2 min cooldown).", inline=False)
     embed.add_field(name="🎰 !slot <amount>", value="Spin the slot machine. Min bet: $50. Win up to 2x your bet.", inline=False)
     embed.add_field(name="🃏 !blackjack <amount>", value="Play blackjack. Min bet: $100. Commands during game: hit, stand, double.", inline=False)
@@ -1816,25 +3886,62 @@ async def commands(ctx):
 @bot.event
 async def on_ready():
     print(f"[✓] Bot is online as {bot.user}")
-    if not run_penalty_check.is_running():
-        run_penalty_check.start()
-    if not stock_market_loop.is_running():
-        stock_market_loop.start()
-    if not income_report_loop.is_running():
-        income_report_loop.start()
-    if not  company_income_loop.is_running():
-        company_income_loop.start()
+    if not economy_tick_loop.is_running():
+        economy_tick_loop.start()
+    if STATE_FLUSH_INTERVAL > 0 and not state_flush_loop.is_running():
+        state_flush_loop.start()
+    if not journal_compact_loop.is_running():
+        journal_compact_loop.start()
+    if PERF_METRICS_FILE and not perf_metrics_loop.is_running():
+        perf_metrics_loop.start()
 
 token = os.getenv("DISCORD_TOKEN")
 
+STATE_FILES = [
+    DATA_FILE, COMPANY_FILE, STOCK_FILE, USER_STOCK_FILE, INVENTORY_FILE, STATS_FILE,
+    GUARD_FILE, ZONE_FILE, BOUNTY_FILE, ASSASSINATION_STATS_FILE, ORDER_FILE, TICK_STATE_FILE
+]
+
 async def main():
     try:
-        for file, lock in [(DATA_FILE, data_lock), (COMPANY_FILE, company_lock), (STOCK_FILE, stock_lock), (USER_STOCK_FILE, user_stock_lock)]:
-            await ensure_file_exists(file)
+        # Tüm dosyaları başlangıçta bir kez belleğe al
+        for path in STATE_FILES:
+            await read_json(path)
         await bot.start(token)
     except Exception as e:
         print(f"Bot stopped with exception: {e}")
-
-
-asyncio.run(main())
+    finally:
+        await flush_all_stores()
+        await checkpoint_journal()
+        state_journal.close()
+        await price_history.save()
+        if json_pool is not None:
+            json_pool.shutdown()
+        if PERF_METRICS_FILE:
+            await dump_metrics()
+        print(cache_summary())
+
+async def import_json_to_sqlite():
+    # Tek seferlik geçiş: mevcut MAIN*.json dosyalarını sqlite tablolarına aktarır
+    source = JsonStorage()
+    target = SqliteStorage(SQLITE_PATH)
+    journal = StateJournal(JOURNAL_FILE)
+    for path in STATE_FILES:
+        if not os.path.exists(path):
+            continue
+        data, _ = await source.load(path)
+        # Günlükte kalan değişiklikler de aktarılsın
+        journal.recover(path, data)
+        migrate = STORE_MIGRATIONS.get(path)
+        if migrate is not None:
+            migrate(data)
+        await target.save(path, data, seq=journal.seq)
+        print(f"[import] {path} -> {SQLITE_PATH} ({len(data)} rows)")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["import-json"]:
+        asyncio.run(import_json_to_sqlite())
+    else:
+        asyncio.run(main())
 
@@ -0,0 +1,196 @@
+# Komut verim ölçümü: Main.py içindeki komut coroutine'lerini sahte ctx/Member
+# nesneleriyle, ağ bağlantısı olmadan çalıştırır ve komut başına commands/sec,
+# p50 ve p99 gecikmeyi raporlar.
+#
+#   python bench_commands.py --users 1000,10000,100000 --ops 500
+#   STORAGE_BACKEND=sqlite python bench_commands.py --output bench_output.txt
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+from gen_dataset import generate, write_dataset
+
+DEFAULT_COMMANDS = ["pay", "work", "slot", "buystock", "hire", "leaderstats", "portfolio"]
+HEAVY_COMMANDS = {"leaderstats"}  # tüm store'u tarar, daha az tekrarlanır
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = int(user_id)
+        self.name = f"user{user_id}"
+        self.display_name = self.name
+        self.mention = f"<@{user_id}>"
+        self.bot = False
+
+
+class FakeMessage:
+    async def edit(self, *args, **kwargs):
+        pass
+
+    async def add_reaction(self, *args, **kwargs):
+        pass
+
+
+class FakeChannel:
+    def __init__(self):
+        self.sent = 0
+
+    async def send(self, *args, **kwargs):
+        self.sent += 1
+        return FakeMessage()
+
+
+class FakeContext:
+    def __init__(self, author, channel):
+        self.author = author
+        self.channel = channel
+        self.guild = None
+        self.message = None
+
+    async def send(self, *args, **kwargs):
+        return await self.channel.send(*args, **kwargs)
+
+
+def stop_writers(M):
+    for store in M.stores.values():
+        if store.writer.task is not None:
+            store.writer.task.cancel()
+
+
+def reset_main(M):
+    # Her veri boyutu için temiz bir durum: store kaydı, günlük ve sqlite bağlantısı yeniden kurulur
+    M.state_journal.close()
+    stop_writers(M)
+    M.stores.clear()
+    M.state_journal = M.StateJournal(M.JOURNAL_FILE)
+    if M.STORAGE_BACKEND == "sqlite":
+        M.storage = M.SqliteStorage(M.SQLITE_PATH)
+
+
+def command_args(M, name, ctx, rng, users, market):
+    if name == "pay":
+        return (ctx, FakeUser(rng.choice(users)), rng.randint(1, 100))
+    if name == "slot":
+        return (ctx, 100)
+    if name == "buystock":
+        return (ctx, rng.choice(market), 1)
+    if name == "hire":
+        return (ctx, 1)
+    return (ctx,)
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def bench_command(M, name, ops, concurrency, users, market, rng, channel):
+    callback = M.bot.get_command(name).callback
+    latencies = []
+
+    async def worker(count):
+        for _ in range(count):
+            ctx = FakeContext(FakeUser(rng.choice(users)), channel)
+            args = command_args(M, name, ctx, rng, users, market)
+            started = time.perf_counter()
+            await callback(*args)
+            latencies.append(time.perf_counter() - started)
+
+    share = [ops // concurrency + (1 if i < ops % concurrency else 0) for i in range(concurrency)]
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(count) for count in share if count))
+    elapsed = time.perf_counter() - started
+    return ops / elapsed, percentile(latencies, 0.5), percentile(latencies, 0.99)
+
+
+async def bench_size(M, n_users, args, report):
+    if M.STORAGE_BACKEND == "sqlite":
+        await M.import_json_to_sqlite()
+
+    started = time.perf_counter()
+    for path in M.STATE_FILES:
+        await M.read_json(path)
+    load_time = time.perf_counter() - started
+
+    users = list(M.stores[M.DATA_FILE].data)
+    market = list(M.stores[M.STOCK_FILE].data)
+    rng = random.Random(args.seed)
+    channel = FakeChannel()
+
+    report(f"\n== {n_users:,} users (backend={M.storage.name}, load {load_time * 1000:.0f} ms) ==")
+    report(f"{'command':<12} {'ops':>6} {'cmd/s':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    for name in args.commands:
+        ops = max(args.ops // 10, 20) if name in HEAVY_COMMANDS else args.ops
+        rate, p50, p99 = await bench_command(M, name, ops, args.concurrency, users, market, rng, channel)
+        report(f"{name:<12} {ops:>6} {rate:>10,.0f} {p50 * 1000:>9.3f} {p99 * 1000:>9.3f}")
+
+    started = time.perf_counter()
+    await M.flush_all_stores()
+    await M.checkpoint_journal()
+    report(f"{'checkpoint':<12} {'':>6} {'':>10} {(time.perf_counter() - started) * 1000:>9.1f} ms")
+
+
+async def run(args):
+    lines = []
+
+    def report(line):
+        print(line)
+        lines.append(line)
+
+    M = None
+    for n_users in args.users:
+        workdir = tempfile.mkdtemp(prefix="bench_")
+        try:
+            write_dataset(workdir, generate(n_users, max_employees=10, seed=args.seed))
+            os.chdir(workdir)
+            if M is None:
+                import Main as M
+                # leaderstats kullanıcı adlarını Discord'dan çeker, ağ yerine sahte kullanıcı döner
+                async def fetch_user(user_id):
+                    return FakeUser(user_id)
+                M.bot.fetch_user = fetch_user
+            else:
+                reset_main(M)
+            await bench_size(M, n_users, args, report)
+            M.state_journal.close()
+            stop_writers(M)
+        finally:
+            os.chdir(ROOT)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark economy bot commands without Discord.")
+    parser.add_argument("--users", default="1000,10000,100000",
+                        help="comma separated store sizes (default: 1000,10000,100000)")
+    parser.add_argument("--ops", type=int, default=500, help="invocations per command (default: 500)")
+    parser.add_argument("--commands", default=",".join(DEFAULT_COMMANDS),
+                        help="comma separated commands to run")
+    parser.add_argument("--concurrency", type=int, default=1, help="concurrent invocations (default: 1)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the report to this file (e.g. bench_output.txt)")
+    args = parser.parse_args()
+    args.users = [int(n) for n in args.users.split(",")]
+    args.commands = args.commands.split(",")
+    if args.output:
+        args.output = os.path.abspath(args.output)
+
+    # Günlük/flush aralıkları ölçümü bozmasın, değişiklikler sonda checkpoint'lenir
+    os.environ.setdefault("STATE_FLUSH_INTERVAL", "3600")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
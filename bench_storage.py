@@ -0,0 +1,136 @@
+# Depolama ölçekleme ölçümü: gen_dataset.py ile üretilen veride her arka uç için
+# soğuk yükleme, tam kayıt ve tek kullanıcı güncelleme maliyetini ölçer.
+#
+#   python bench_storage.py --users 10000,100000,1000000
+#   python bench_storage.py --users 1000000 --companies 50000 --output bench_output.txt
+#
+# "json" her güncellemede tüm dosyayı yeniden yazar, "sqlite" sadece değişen satırı,
+# "journal" ise write_json'un anahtarlı yolunu (günlüğe tek satır ekleme) ölçer.
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+from gen_dataset import generate, write_dataset
+
+STORES = ["MAINBank.json", "MAINCompanies.json", "MAINStockMarket.json",
+          "MAINUserStocks.json", "MAINGuards.json", "MAINZoneSlots.json"]
+
+
+async def timed(coro_factory, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = await coro_factory()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples), result
+
+
+async def bench_backend(backend, path, update_key, repeat):
+    async def load():
+        data, _ = await backend.load(path)
+        return data
+
+    load_time, data = await timed(load, 1)
+    save_time, written = await timed(lambda: backend.save(path, data), repeat)
+    update_time, _ = await timed(lambda: backend.save(path, data, keys=[update_key]), repeat)
+    return load_time, save_time, update_time, written
+
+
+async def bench_journal(M, path, update_key, repeat):
+    # write_json'un anahtarlı yolu: satır günlüğe eklenir, snapshot checkpoint'e kalır
+    data = await M.read_json(path)
+    update_time, _ = await timed(lambda: M.write_json(path, data, keys=[update_key]), repeat)
+    return update_time
+
+
+async def bench_size(M, args, n_users, report):
+    workdir = tempfile.mkdtemp(prefix="bench_storage_")
+    try:
+        started = time.perf_counter()
+        data = generate(n_users, args.companies, args.max_employees, seed=args.seed)
+        sizes = write_dataset(workdir, {path: data[path] for path in STORES})
+        gen_time = time.perf_counter() - started
+        update_keys = {path: next(iter(data[path]), None) for path in STORES}
+        del data
+        os.chdir(workdir)
+
+        report(f"\n== {n_users:,} users (generated in {gen_time:.1f}s) ==")
+        report(f"{'store':<22} {'backend':<8} {'size MB':>9} {'load ms':>10} {'save ms':>10} {'1-user ms':>10}")
+
+        json_backend = M.JsonStorage()
+        sqlite_backend = M.SqliteStorage(os.path.join(workdir, "bench.db"))
+        for path in STORES:
+            key = update_keys[path]
+            if key is None:
+                continue
+            load, save, update, _ = await bench_backend(json_backend, path, key, args.repeat)
+            # JSON dosyası satır satır yazılamaz, tek kullanıcı güncellemesi tam kayıttır
+            report(f"{path:<22} {'json':<8} {sizes[path] / 1e6:>9.1f} {load * 1000:>10.1f} {save * 1000:>10.1f} {update * 1000:>10.1f}")
+
+            data, _ = await json_backend.load(path)
+            await sqlite_backend.save(path, data)
+            del data
+            load, save, update, written = await bench_backend(sqlite_backend, path, key, args.repeat)
+            report(f"{'':<22} {'sqlite':<8} {written / 1e6:>9.1f} {load * 1000:>10.1f} {save * 1000:>10.1f} {update * 1000:>10.3f}")
+
+            update = await bench_journal(M, path, key, args.repeat)
+            report(f"{'':<22} {'journal':<8} {'':>9} {'':>10} {'':>10} {update * 1000:>10.3f}")
+        sqlite_backend.conn.close()
+    finally:
+        M.state_journal.close()
+        for store in M.stores.values():
+            if store.writer.task is not None:
+                store.writer.task.cancel()
+        M.stores.clear()
+        M.state_journal = M.StateJournal(M.JOURNAL_FILE)
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+async def run(args):
+    lines = []
+
+    def report(line):
+        print(line)
+        lines.append(line)
+
+    import Main as M
+    for n_users in args.users:
+        await bench_size(M, args, n_users, report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark storage backends on synthetic datasets.")
+    parser.add_argument("--users", default="10000,100000",
+                        help="comma separated dataset sizes (default: 10000,100000)")
+    parser.add_argument("--companies", type=int, help="companies per dataset (default: users / 5)")
+    parser.add_argument("--max-employees", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5, help="median of this many saves/updates (default: 5)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the report to this file (e.g. bench_output.txt)")
+    args = parser.parse_args()
+    args.users = [int(n) for n in args.users.split(",")]
+    if args.output:
+        args.output = os.path.abspath(args.output)
+
+    # Arka uçlar doğrudan kurulur; Main'in kendi store'ları (journal ölçümü) JSON dosyalarından okur
+    os.environ["STORAGE_BACKEND"] = "json"
+    os.environ.setdefault("STATE_FLUSH_INTERVAL", "3600")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# Sahte ekonomi verisi üretici: istenen ölçekte MAIN*.json dosyaları yazar.
+#
+#   python gen_dataset.py --users 1000000 --companies 50000 --max-employees 100 --out data_1m
+#
+# bench_commands.py ve bench_storage.py aynı üreticiyi kullanır.
+import argparse
+import json
+import os
+import random
+import time
+
+USER_ID_BASE = 10 ** 17  # Discord snowflake büyüklüğünde kimlikler
+ITEMS = ["coffee", "laptop", "car", "briefcase", "suit", "watch", "smartphone", "assistant"]
+GUARD_TYPES = ["normal", "shielder", "sniper"]
+MAX_GUARDS = {5: 25, 10: 65, 15: 95, 20: 135}
+MAX_EMPLOYEES = [10, 15, 20, 30, 50, 75, 100]  # ofis seviyesine göre
+
+
+def user_ids(n_users):
+    return [str(USER_ID_BASE + i) for i in range(n_users)]
+
+
+def generate(n_users, n_companies=None, max_employees=100, n_stocks=20, seed=1):
+    # Store adı -> içerik. Dağılımlar kabaca gerçek sunucuya benzer: bakiyeler log-normal,
+    # az sayıda kullanıcının kredisi, şirketi, hissesi ve korumaları var.
+    rng = random.Random(seed)
+    users = user_ids(n_users)
+    if n_companies is None:
+        n_companies = n_users // 5
+    n_companies = min(n_companies, n_users)
+    stocks = [f"stock_{i}" for i in range(n_stocks)]
+    now = time.time()
+
+    bank, stats, inventory = {}, {}, {}
+    for user_id in users:
+        row = {"bank_points": int(rng.lognormvariate(10, 1.5)), "loan_amount": 0, "loan_timestamp": None}
+        if rng.random() < 0.05:
+            row["loan_amount"] = rng.randint(1_000, 500_000)
+            row["loan_timestamp"] = now - rng.uniform(0, 10 * 86400)
+        bank[user_id] = row
+        stats[user_id] = {"strength": rng.randint(1, 10), "endurance": 1, "level": 1, "xp": rng.randint(0, 99)}
+        inventory[user_id] = {item: 1 for item in rng.sample(ITEMS, rng.randint(0, 3))}
+
+    companies = {}
+    for user_id in rng.sample(users, n_companies):
+        employees = rng.randint(0, max_employees)
+        level = next((i + 1 for i, cap in enumerate(MAX_EMPLOYEES) if cap >= employees), len(MAX_EMPLOYEES))
+        # Çalışanlar birkaç işe alım dalgası halinde, her dalga aynı seviye/xp kohortunda
+        cohorts = {}
+        for _ in range(employees):
+            wave = rng.randint(1, 10) if len(cohorts) < 4 else rng.choice(list(cohorts))
+            cohorts.setdefault(wave, {"level": wave, "xp": 15 * rng.randint(0, 6), "count": 0})["count"] += 1
+        companies[user_id] = {
+            "company_name": f"Company {user_id[-6:]}",
+            "office_level": level,
+            "employees": sorted(cohorts.values(), key=lambda cohort: (cohort["level"], cohort["xp"])),
+        }
+
+    market = {}
+    for name in stocks:
+        value = rng.randint(100, 5_000)
+        market[name] = {
+            "stock_value": value,
+            "previous_value": value,
+            "owner": rng.choice(users) if rng.random() < 0.3 else None,
+        }
+
+    userstocks, guards, zoneslots = {}, {}, {}
+    for user_id in users:
+        if rng.random() < 0.3:
+            userstocks[user_id] = {name: rng.randint(1, 500) for name in rng.sample(stocks, rng.randint(1, 5))}
+        if rng.random() < 0.1:
+            zones = rng.choice([5, 5, 5, 10, 15, 20])
+            if zones != 5:
+                zoneslots[user_id] = zones
+            guards[user_id] = [{"zone": rng.randint(1, zones), "type": rng.choice(GUARD_TYPES)}
+                               for _ in range(rng.randint(1, MAX_GUARDS[zones]))]
+
+    return {
+        "MAINBank.json": bank,
+        "MAINCompanies.json": companies,
+        "MAINStockMarket.json": market,
+        "MAINUserStocks.json": userstocks,
+        "MAINUserStats.json": stats,
+        "MAINUserInventory.json": inventory,
+        "MAINGuards.json": guards,
+        "MAINZoneSlots.json": zoneslots,
+    }
+
+
+def write_dataset(out_dir, data, indent=4):
+    # Bot dosyaları indent=4 ile yazar, aynı biçim kullanılır
+    os.makedirs(out_dir, exist_ok=True)
+    sizes = {}
+    for path, content in data.items():
+        full_path = os.path.join(out_dir, path)
+        with open(full_path, "w") as f:
+            json.dump(content, f, indent=indent)
+        sizes[path] = os.path.getsize(full_path)
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic economy dataset.")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--companies", type=int, help="default: users / 5")
+    parser.add_argument("--max-employees", type=int, default=100)
+    parser.add_argument("--stocks", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default=".", help="output directory (default: current directory)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    data = generate(args.users, args.companies, args.max_employees, args.stocks, args.seed)
+    sizes = write_dataset(args.out, data)
+    for path, size in sizes.items():
+        print(f"{path:<26} {len(data[path]):>10,} rows {size / 1e6:>10.1f} MB")
+    print(f"done in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# Emir defteri testleri: python -m unittest test_orders
+import os
+import sys
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+import Main as M  # noqa: E402
+
+
+def make_order(order_id, side, order_type, price, amount, user="1", stock="acme"):
+    escrow = price * amount if side == "buy" else 0
+    return {"id": order_id, "user": user, "stock": stock, "side": side, "type": order_type,
+            "price": price, "amount": amount, "escrow": escrow, "created": 0}
+
+
+class OrderBookTest(unittest.TestCase):
+    def setUp(self):
+        self.books = M.OrderBooks()
+        self.orders = {}
+
+    def add(self, *args, **kwargs):
+        order = make_order(*args, **kwargs)
+        self.orders[order["id"]] = order
+        self.books.push(order)
+        return order
+
+    def test_price_time_priority(self):
+        self.add("1", "buy", "limit", 90, 1)
+        self.add("2", "buy", "limit", 100, 1)
+        self.add("3", "buy", "limit", 100, 1)
+        self.add("4", "buy", "limit", 80, 1)
+        self.add("5", "sell", "limit", 70, 1)
+        self.add("6", "sell", "limit", 60, 1)
+
+        triggered = self.books.pop_triggered({"acme": {"stock_value": 85}}, self.orders)
+
+        # Alışta yüksek fiyat önce, aynı fiyatta önce verilen; satışta düşük fiyat önce
+        self.assertEqual([order_id for order_id, _ in triggered if self.orders[order_id]["side"] == "buy"], ["2", "3", "1"])
+        self.assertEqual([order_id for order_id, _ in triggered if self.orders[order_id]["side"] == "sell"], ["6", "5"])
+        self.assertEqual({price for _, price in triggered}, {85})
+        self.assertEqual(self.books.books["acme"][("buy", "limit")], [(-80, 4, "4")])
+
+    def test_stop_orders_trigger_on_the_other_side(self):
+        self.add("1", "buy", "stop", 120, 1)
+        self.add("2", "sell", "stop", 90, 1)
+        self.assertEqual(self.books.pop_triggered({"acme": {"stock_value": 100}}, self.orders), [])
+        self.assertEqual(self.books.pop_triggered({"acme": {"stock_value": 125}}, self.orders), [("1", 125)])
+        self.assertEqual(self.books.pop_triggered({"acme": {"stock_value": 80}}, self.orders), [("2", 80)])
+
+    def test_cancelled_orders_are_skipped_and_dropped(self):
+        self.add("1", "buy", "limit", 100, 1)
+        self.add("2", "buy", "limit", 50, 1)
+        self.add("3", "buy", "limit", 200, 1)
+        del self.orders["1"]
+        del self.orders["2"]
+
+        self.assertEqual(self.books.pop_triggered({"acme": {"stock_value": 150}}, self.orders), [("3", 150)])
+        # Fiyatı tetiklenmeyen iptal edilmiş emir de en üste gelince çıkarılır
+        self.assertEqual(self.books.books["acme"][("buy", "limit")], [])
+
+    def test_entries_of_a_changed_order_type_are_skipped(self):
+        order = self.add("1", "buy", "stop", 100, 1)
+        self.orders["1"] = {**order, "type": "limit"}
+        self.assertEqual(self.books.pop_triggered({"acme": {"stock_value": 150}}, self.orders), [])
+        self.assertEqual(self.books.books["acme"][("buy", "stop")], [])
+
+
+class FillOrderTest(unittest.TestCase):
+    def setUp(self):
+        self.bank = {"1": {"bank_points": 0, "loan_amount": 0, "loan_timestamp": None}}
+        self.userstocks = {}
+        self.orders = {}
+        self.tx = M.Transaction({M.DATA_FILE: self.bank, M.USER_STOCK_FILE: self.userstocks, M.ORDER_FILE: self.orders})
+        self.token = M.current_tx.set(self.tx)
+        self.books = M.order_books
+        M.order_books = M.OrderBooks()
+        self.flow = dict(M.tick_engine.flow)
+
+    def tearDown(self):
+        M.current_tx.reset(self.token)
+        M.order_books = self.books
+        M.tick_engine.flow = self.flow
+
+    def fill(self, order, price):
+        self.orders[order["id"]] = order
+        return M.fill_order(self.tx, order, price)
+
+    def test_limit_buy_refunds_the_price_difference(self):
+        self.assertEqual(self.fill(make_order("1", "buy", "limit", 100, 3), 80), 3)
+        self.assertEqual(self.userstocks["1"], {"acme": 3})
+        self.assertEqual(self.bank["1"]["bank_points"], 60)
+        self.assertEqual(self.orders, {})
+
+    def test_sell_pays_the_fill_price(self):
+        self.assertEqual(self.fill(make_order("1", "sell", "limit", 100, 3), 120), 3)
+        self.assertEqual(self.bank["1"]["bank_points"], 360)
+
+    def test_stop_buy_above_escrow_keeps_the_remainder(self):
+        # 10 x $100 emanet, $300'dan tetiklenir: 3 hisse alınır, kalan $100 ile 1 hisse limit olarak bekler
+        self.assertEqual(self.fill(make_order("1", "buy", "stop", 100, 10), 300), 3)
+        self.assertEqual(self.userstocks["1"], {"acme": 3})
+        remainder = self.orders["1"]
+        self.assertEqual((remainder["type"], remainder["amount"], remainder["escrow"], remainder["filled"]), ("limit", 1, 100, 3))
+        self.assertEqual(self.bank["1"]["bank_points"], 0)
+        self.assertEqual(M.order_books.pop_triggered({"acme": {"stock_value": 90}}, self.orders), [("1", 90)])
+
+    def test_stop_buy_refunds_escrow_too_small_for_the_remainder(self):
+        self.assertEqual(self.fill(make_order("1", "buy", "stop", 100, 2), 150), 1)
+        self.assertEqual(self.orders, {})
+        self.assertEqual(self.bank["1"]["bank_points"], 50)
+
+    def test_rollback_restores_filled_orders_to_the_book(self):
+        self.fill(make_order("1", "buy", "stop", 100, 10), 300)
+        self.tx.on_rollback(M.order_books.restore, self.orders, [("1", 300)])
+        with mock.patch.object(M.state_journal, "write"):
+            self.tx.rollback()
+        self.assertEqual(self.orders["1"]["type"], "stop")
+        self.assertEqual(self.bank["1"]["bank_points"], 0)
+        self.assertNotIn("1", self.userstocks)
+        # Bayat limit kaydı atlanır, stop emri yeniden tetiklenebilir
+        self.assertEqual(M.order_books.pop_triggered({"acme": {"stock_value": 300}}, self.orders), [("1", 300)])
+
+
+if __name__ == "__main__":
+    unittest.main()
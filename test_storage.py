@@ -0,0 +1,70 @@
+# Depolama arka ucu testleri: python -m unittest test_storage
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+import Main as M  # noqa: E402
+
+WORKDIR = tempfile.mkdtemp(prefix="test_storage_")
+
+
+def tearDownModule():
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+class SnapshotTest(unittest.TestCase):
+    # Döngü dışındaki iş sürerken komutlar satırları değiştirmeye devam eder;
+    # diske giden veri save çağrıldığı andaki hali olmalı
+    def save_while_changing(self, storage, path, data, change, **kwargs):
+        offload = M.offload
+
+        async def racing_offload(func, *args, **kw):
+            change()
+            return await offload(func, *args, **kw)
+
+        async def scenario():
+            await storage.save(path, data, **kwargs)
+            return await storage.load(path)
+
+        M.offload = racing_offload
+        try:
+            return asyncio.run(scenario())
+        finally:
+            M.offload = offload
+
+    def test_json_save_is_a_snapshot(self):
+        path = os.path.join(WORKDIR, "MAINBank.json")
+        data = {"1": {"bank_points": 100, "loan_amount": 0}}
+
+        def change():
+            data["1"]["bank_points"] = 50
+            data["2"] = {"bank_points": 1}
+
+        self.save_while_changing(M.JsonStorage(), path, data, change, seq=7)
+        with open(path) as f:
+            saved = json.load(f)
+        self.assertEqual(saved, {"1": {"bank_points": 100, "loan_amount": 0}, M.JOURNAL_SEQ_KEY: 7})
+
+    def test_sqlite_save_is_a_snapshot(self):
+        storage = M.SqliteStorage(os.path.join(WORKDIR, "MAINEconomy.db"))
+        data = {"1": {"bank_points": 100}, "2": {"bank_points": 5}}
+
+        def change():
+            if "2" in data:
+                data["1"]["bank_points"] = 50
+                del data["2"]
+
+        loaded, _ = self.save_while_changing(storage, "MAINBank.json", data, change, keys=["1", "2"])
+        self.assertEqual(loaded, {"1": {"bank_points": 100}, "2": {"bank_points": 5}})
+        storage.conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
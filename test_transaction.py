@@ -0,0 +1,192 @@
+# İşlem geri alma testleri: python -m unittest test_transaction
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+WORKDIR = tempfile.mkdtemp(prefix="test_tx_")
+os.chdir(WORKDIR)
+os.environ.setdefault("STATE_FLUSH_INTERVAL", "3600")
+
+import Main as M  # noqa: E402
+
+# Store kilitleri ve yazıcılar ilk kullanıldıkları döngüye bağlanır, tüm testler tek döngüde koşar
+LOOP = asyncio.new_event_loop()
+
+
+def tearDownModule():
+    M.state_journal.close()
+    writers = [store.writer.task for store in M.stores.values() if store.writer.task is not None]
+    for task in writers:
+        task.cancel()
+    LOOP.run_until_complete(asyncio.gather(*writers, return_exceptions=True))
+    LOOP.close()
+    os.chdir(ROOT)
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+class TransactionRollbackTest(unittest.TestCase):
+    def run_async(self, coro):
+        return LOOP.run_until_complete(coro)
+
+    def test_rollback_restores_existing_and_removes_new_rows(self):
+        async def scenario():
+            bank = await M.read_json(M.DATA_FILE)
+            bounties = await M.read_json(M.BOUNTY_FILE)
+            bank["1"] = {"bank_points": 500, "loan_amount": 0, "loan_timestamp": None}
+            bounties.pop("2", None)
+
+            with self.assertRaises(RuntimeError):
+                async with M.transaction(M.DATA_FILE, M.BOUNTY_FILE, reason="test") as tx:
+                    M.adjust_balance(tx[M.DATA_FILE], "1", -200, "test")
+                    tx.touch(M.BOUNTY_FILE, "2")
+                    tx[M.BOUNTY_FILE]["2"] = 10000
+                    raise RuntimeError("send failed")
+
+            self.assertEqual(bank["1"]["bank_points"], 500)
+            self.assertNotIn("2", bounties)
+            # Geri alınan store'lar hâlâ diske yazılabilmeli
+            await M.write_json(M.BOUNTY_FILE, bounties)
+            await M.flush_all_stores()
+            await M.checkpoint_journal()
+
+        self.run_async(scenario())
+
+    def test_rollback_of_new_bank_row(self):
+        async def scenario():
+            bank = await M.read_json(M.DATA_FILE)
+            bank.pop("3", None)
+
+            with self.assertRaises(RuntimeError):
+                async with M.transaction(M.DATA_FILE, reason="test") as tx:
+                    M.ensure_account(tx[M.DATA_FILE], "3")
+                    M.adjust_balance(tx[M.DATA_FILE], "3", 100, "test")
+                    raise RuntimeError("tick failed")
+
+            self.assertNotIn("3", bank)
+            await M.write_json(M.DATA_FILE, bank)
+            await M.flush_all_stores()
+
+        self.run_async(scenario())
+
+    def test_rollback_rebuilds_loan_schedule(self):
+        async def scenario():
+            bank = await M.read_json(M.DATA_FILE)
+            now = 10 * M.LOAN_PENALTY_INTERVAL
+            # İki aşaması gecikmiş kredi ve loan_stage'i olmayan eski kayıt
+            bank["4"] = {"bank_points": 1000, "loan_amount": 400, "loan_stage": 0,
+                         "loan_timestamp": now - 2.5 * M.LOAN_PENALTY_INTERVAL}
+            bank["5"] = {"bank_points": 1000, "loan_amount": 400, "loan_timestamp": now - 1.5 * M.LOAN_PENALTY_INTERVAL}
+            M.loan_schedule.reset()
+
+            with self.assertRaises(RuntimeError):
+                async with M.transaction(M.DATA_FILE, reason="test") as tx:
+                    M.apply_loan_penalties(tx[M.DATA_FILE], now)
+                    raise RuntimeError("tick failed")
+
+            self.assertEqual((bank["4"]["loan_amount"], bank["4"]["loan_stage"]), (400, 0))
+            self.assertNotIn("loan_stage", bank["5"])
+
+            # Geri alınan aşamalar bir sonraki tick'te yeniden uygulanır
+            async with M.transaction(M.DATA_FILE, reason="test") as tx:
+                self.assertEqual(M.apply_loan_penalties(tx[M.DATA_FILE], now), ["4", "4"])
+            self.assertEqual((bank["4"]["loan_amount"], bank["4"]["loan_stage"]), (225, 2))
+            self.assertEqual(bank["5"]["loan_stage"], 1)
+
+        self.run_async(scenario())
+    def test_failed_tick_leaves_no_partial_changes(self):
+        async def scenario():
+            bank = await M.read_json(M.DATA_FILE)
+            companies = await M.read_json(M.COMPANY_FILE)
+            market = await M.read_json(M.STOCK_FILE)
+            orders = await M.read_json(M.ORDER_FILE)
+            await M.read_json(M.USER_STOCK_FILE)
+            bank["6"] = {"bank_points": 0, "loan_amount": 0, "loan_timestamp": None}
+            companies["6"] = {"company_name": "Six", "office_level": 1, "employees": [{"level": 3, "xp": 0, "count": 2}]}
+            market["six"] = {"stock_value": 100, "owner": "6"}
+            # Her fiyatta tetiklenen satış emri
+            orders["900"] = {"id": "900", "user": "6", "stock": "six", "side": "sell", "type": "limit",
+                             "price": 1, "amount": 2, "escrow": 0, "created": 0}
+            M.order_books.loaded = False
+            M.order_books.books = {}
+            M.loan_schedule.reset()
+
+            def failing_penalties(data, now):
+                raise RuntimeError("penalty failed")
+
+            penalties, M.apply_loan_penalties = M.apply_loan_penalties, failing_penalties
+            try:
+                self.assertEqual(await M.run_economy_tick(), ([], []))
+            finally:
+                M.apply_loan_penalties = penalties
+
+            self.assertEqual(bank["6"]["bank_points"], 0)
+            self.assertEqual(companies["6"]["employees"], [{"level": 3, "xp": 0, "count": 2}])
+            self.assertIn("900", orders)
+
+            # Geri alınan emir yığına döndü, sonraki tick'te gerçekleşir
+            company_reports, owner_summary = await M.run_economy_tick()
+            self.assertNotIn("900", orders)
+            self.assertEqual(companies["6"]["employees"], [{"level": 3, "xp": 15, "count": 2}])
+            self.assertEqual([report["user_id"] for report in company_reports], ["6"])
+            self.assertGreater(bank["6"]["bank_points"], company_reports[0]["income"])
+
+        self.run_async(scenario())
+
+    def test_dividend_timer_is_stored(self):
+        async def scenario():
+            bank = await M.read_json(M.DATA_FILE)
+            market = await M.read_json(M.STOCK_FILE)
+            userstocks = await M.read_json(M.USER_STOCK_FILE)
+            tick_meta = await M.read_json(M.TICK_STATE_FILE)
+            bank["7"] = {"bank_points": 0, "loan_amount": 0, "loan_timestamp": None}
+            market["seven"] = {"stock_value": 100, "owner": None}
+            userstocks["7"] = {"seven": 10000}
+            M.holder_index.invalidate()
+            tick_meta.pop("dividends", None)
+
+            # İlk tick sayacı başlatır, ödeme yapmaz
+            await M.run_economy_tick()
+            self.assertEqual(bank["7"]["bank_points"], 0)
+            last_paid = tick_meta["dividends"]["last_paid"]
+
+            # Yeniden başlatma sayacı sıfırlamaz: store'daki zaman geçmişse ödenir
+            tick_meta["dividends"]["last_paid"] = last_paid - M.DIVIDEND_INTERVAL
+            await M.run_economy_tick()
+            self.assertGreater(bank["7"]["bank_points"], 0)
+            self.assertGreater(tick_meta["dividends"]["last_paid"], last_paid - M.DIVIDEND_INTERVAL)
+
+        self.run_async(scenario())
+
+    def test_leaderboard_settles_only_possible_leaders(self):
+        async def scenario():
+            market = await M.read_json(M.STOCK_FILE)
+            await M.read_json(M.COMPANY_FILE)
+            bank = await M.read_json(M.DATA_FILE)
+            market["p11"] = {"stock_value": 1, "owner": "11", "income_index": 5000, "owner_settled": 0}
+            market["p12"] = {"stock_value": 1, "owner": "12", "income_index": 10, "owner_settled": 0}
+            M.owner_index.invalidate()
+            M.pending_cache.invalidate()
+            ranking = M.Ranking()
+            ranking.reset({"10": 3000, "12": 2000, "13": 1000})
+
+            mode, M.INCOME_MODE = M.INCOME_MODE, "accrual"
+            try:
+                # İlk 2: 11 (0 + 5000) ve 10 (3000); 12'nin 2010'u yetmez, ödenmez
+                self.assertEqual(await M.settle_leaders(ranking, 2), 5000)
+            finally:
+                M.INCOME_MODE = mode
+            self.assertEqual(bank["11"]["bank_points"], 5000)
+            self.assertEqual(market["p12"]["owner_settled"], 0)
+            self.assertNotIn("11", M.pending_cache.pending)
+
+        self.run_async(scenario())
+
+
+if __name__ == "__main__":
+    unittest.main()